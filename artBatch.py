@@ -0,0 +1,103 @@
+from itertools import combinations
+import pandas as pd
+from participantLoader import map_participants, worker_count
+
+# Aligned rank transform (ARTool, https://depts.washington.edu/acelab/proj/art/) for many dependent
+# variables and every main effect / interaction contrast. Dependent variables are spread over worker
+# processes; each worker starts one R session, transfers the long-format data once and then fits one
+# art() model per dependent variable and runs art.con for every term.
+# rpy2 is imported inside the workers only: an embedded R session does not survive a fork.
+
+ART_FACTORS = ['Movement', 'ReferenceFrame', 'TargetSize']
+
+# Main effects and interactions, e.g. 'Movement', ..., 'Movement:ReferenceFrame:TargetSize'
+def contrast_terms(factors=ART_FACTORS):
+    return [':'.join(term) for count in range(1, len(factors) + 1) for term in combinations(factors, count)]
+
+# Long-format frame as ARTool expects it: categorical factors and ParticipantID
+def art_frame(data, dependent_variables, factors=ART_FACTORS):
+    frame = data[['ParticipantID', *factors, *dependent_variables]].copy()
+    for factor in factors:
+        frame[factor] = frame[factor].astype(str).astype('category')
+    frame['ParticipantID'] = frame['ParticipantID'].apply(str).astype('category')
+    return frame
+
+### Per worker
+def _art_session(args):
+    frame, dependent_variables, factors, terms = args
+    if not dependent_variables:
+        return []
+    import rpy2.robjects.packages as rpackages
+    import rpy2.robjects as ro
+    from rpy2.robjects import pandas2ri
+    rpackages.importr('ARTool')
+
+    with (ro.default_converter + pandas2ri.converter).context():
+        ro.globalenv['art_data'] = ro.conversion.get_conversion().py2rpy(frame)
+    ro.r('''
+        fit_art <- function(dv) {
+            art_model <<- art(as.formula(paste(dv, "~ ''' + '*'.join(factors) + ''' + Error(ParticipantID)")), data=art_data)
+            as.data.frame(anova(art_model))
+        }
+        art_contrasts <- function(term) {
+            as.data.frame(summary(art.con(art_model, term, adjust="bonferroni")))[c('contrast', 'p.value')]
+        }
+    ''')
+    results = []
+    for dependent_variable in dependent_variables:
+        with (ro.default_converter + pandas2ri.converter).context():
+            anova = ro.conversion.get_conversion().rpy2py(ro.globalenv['fit_art'](dependent_variable))
+            contrasts = []
+            for term in terms:
+                term_contrasts = ro.conversion.get_conversion().rpy2py(ro.globalenv['art_contrasts'](term))
+                term_contrasts.insert(0, 'Term', term)
+                contrasts.append(term_contrasts)
+        anova.insert(0, 'DependentVariable', dependent_variable)
+        contrasts = pd.concat(contrasts, ignore_index=True)
+        contrasts.insert(0, 'DependentVariable', dependent_variable)
+        results.append((dependent_variable, anova.reset_index(drop=True), contrasts))
+    return results
+
+### Contrast tables
+# 'A,B - C,D' -> (('A', 'B'), ('C', 'D')); one factor: 'A - C' -> ('A', 'C')
+def parse_contrast(contrast, factor_count):
+    pair = [level.strip() for level in contrast.replace('TargetSize', '').split('-', 1)]
+    if factor_count == 1:
+        return tuple(pair)
+    return tuple(tuple(level.strip() for level in side.split(',')) for side in pair)
+
+def format_p_value(p):
+    if p >= 0.05:
+        return str(p)[:5]
+    return str(p)[:5] + r" \cellcolor[HTML]{C0C0C0}" if p >= 0.001 else r"<0.001 \cellcolor[HTML]{C0C0C0}"
+
+# One column per factor level of both sides of the contrast and the formatted p-value
+def contrast_table(contrasts, factor_count):
+    table = pd.DataFrame(index=contrasts.index)
+    for side in range(2):
+        levels = contrasts['contrast'].map(lambda contrast: contrast[side] if factor_count > 1 else (contrast[side],))
+        for factor in range(factor_count):
+            table[f'Factor-pair {side + 1} ({factor + 1})'] = levels.map(lambda level: level[factor])
+    table['p-value'] = contrasts['p.value'].apply(format_p_value)
+    return table
+
+### Batch
+# Returns anova (all ANOVA tables), contrasts (all Bonferroni-adjusted contrasts with parsed 'contrast'
+# tuples) and latex ({(dependent variable, term): LaTeX contrast table})
+def art_batch(data, dependent_variables, factors=ART_FACTORS, terms=None, workers=None):
+    terms = contrast_terms(factors) if terms is None else terms
+    frame = art_frame(data, dependent_variables, factors)
+    session_count = max(1, min(worker_count(workers), len(dependent_variables)))
+    sessions = [(frame[['ParticipantID', *factors, *dependent_variables[i::session_count]]], dependent_variables[i::session_count], factors, terms)
+                for i in range(session_count)]
+    results = {dependent_variable: (anova, contrasts)
+               for session in map_participants(_art_session, sessions, workers)
+               for dependent_variable, anova, contrasts in session}
+
+    anova = pd.concat([results[dependent_variable][0] for dependent_variable in dependent_variables], ignore_index=True)
+    contrasts = pd.concat([results[dependent_variable][1] for dependent_variable in dependent_variables], ignore_index=True)
+    contrasts['contrast'] = [parse_contrast(contrast, term.count(':') + 1) for contrast, term in zip(contrasts['contrast'], contrasts['Term'])]
+    latex = {}
+    for (dependent_variable, term), term_contrasts in contrasts.groupby(['DependentVariable', 'Term'], sort=False):
+        latex[(dependent_variable, term)] = contrast_table(term_contrasts, term.count(':') + 1).to_latex(index=False)
+    return {'anova': anova, 'contrasts': contrasts, 'latex': latex}
@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from participantLoader import load_participants, worker_count, SELECTIONS, HIGH_FREQUENCY
+from fittsMetrics import add_selection_metrics, condition_throughput
+from dependentVariables import add_dependent_variables, condition_sums, dependent_variables_table, HIGH_FREQUENCY_COLUMNS
+from gaitMetrics import condition_starts, condition_speeds, condition_step_frequencies, GAIT_COLUMNS
+from normalityTests import normality_table
+from figureRenderer import render_box_plots
+from syntheticLogs import add_layout_arguments, layout_arguments, write_study
+
+# Times and memory-profiles every stage of the analysis pipeline on synthetic logs (syntheticLogs.py) of
+# growing size, e.g. python benchmark.py /tmp/synthetic --sizes 1 10 50 200
+# Participants 1..max(sizes) are generated once into the directory and reused; a size n runs on 1..n.
+# Every stage is run once for its wall time and, unless --no-memory, once more under tracemalloc for the
+# peak of the memory it allocates (Python and numpy allocations above the stage's start).
+
+FITTS_VARIABLES = ['Success', 'MT', 'DistanceCM', 'SDx', 'ae', 'WeCM', 'IDe', 'TP']
+# Slowdowns below this are timer noise, not regressions
+MINIMUM_REGRESSION_SECONDS = 0.05
+
+parser = argparse.ArgumentParser()
+parser.add_argument('directory', help='synthetic logs; missing participants are generated')
+parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 20, 50, 100, 200], metavar='N', help='numbers of participants')
+parser.add_argument('--condition-seconds', type=float, default=5, help='minimum length of every condition of generated participants')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--workers', type=int, help='processes for loading, normality and plotting (default: all cores)')
+parser.add_argument('--no-memory', action='store_true', help='only measure wall time')
+parser.add_argument('--output', default='benchmark', help='prefix of the <output>.csv / <output>.json results')
+parser.add_argument('--baseline', metavar='CSV', help='earlier <output>.csv; stages slower by more than --tolerance are reported')
+parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown against --baseline')
+add_layout_arguments(parser)
+args = parser.parse_args()
+directory = args.directory
+sizes = sorted(set(args.sizes))
+
+generated = write_study(directory, 1, sizes[-1], args.condition_seconds, args.seed, args.workers, **layout_arguments(args))
+if generated:
+    print(f'Generated {len(generated)} participants into {directory}')
+
+### Stages
+# Each stage takes the outputs of the earlier ones and returns (output, rows processed). Inputs are
+# copied before a stage where it adds columns, so repeated runs see the same data. state['workers'] is
+# the process count for the pooled stages (loading, normality, plotting).
+def load_selections(state):
+    selections = load_participants(directory, SELECTIONS, 1, state['size'], workers=state['workers'])
+    return selections, len(selections)
+
+def load_high_frequency(state):
+    columns = list(dict.fromkeys(HIGH_FREQUENCY_COLUMNS + GAIT_COLUMNS))
+    high_frequency = load_participants(directory, HIGH_FREQUENCY, 1, state['size'], usecols=columns, workers=state['workers'])
+    return high_frequency, len(high_frequency)
+
+def fitts_metrics(state):
+    selections = add_selection_metrics(state['load_selections'].copy())
+    selections = selections[(selections['SelectionDuration'] != 0) & (selections['b'] < 0.08)]
+    return condition_throughput(selections), len(selections)
+
+def geometric_features(state):
+    data = add_dependent_variables(state['load_high_frequency'].copy())
+    return dependent_variables_table(condition_sums(data)), len(data)
+
+def step_frequency(state):
+    data = state['load_high_frequency']
+    return condition_step_frequencies(data, condition_starts(data)), len(data)
+
+def speeds(state):
+    data = state['load_high_frequency']
+    return condition_speeds(data, condition_starts(data))[0], len(data)
+
+def normality(state):
+    throughput = state['fitts_metrics']
+    return normality_table(throughput, FITTS_VARIABLES, workers=state['workers']), len(throughput) * len(FITTS_VARIABLES)
+
+def plotting(state):
+    throughput = state['fitts_metrics'].copy()
+    throughput['TargetSize'] = throughput['TargetSize'].astype(str)
+    with tempfile.TemporaryDirectory() as figure_directory:
+        rendered = render_box_plots(throughput, ['TP', 'MT'], figure_directory, workers=state['workers'], force=True)
+    return rendered, len(throughput)
+
+# Workers of the traced memory run
+MEMORY_WORKERS = 1
+
+STAGES = [load_selections, load_high_frequency, fitts_metrics, geometric_features, step_frequency, speeds, normality, plotting]
+
+def measure(stage, state):
+    start = time.perf_counter()
+    output, rows = stage(state)
+    seconds = time.perf_counter() - start
+    peak_mb = np.nan
+    if not args.no_memory:
+        # A second, traced run: tracemalloc slows allocation-heavy code down, so it is kept out of the timing.
+        # tracemalloc only sees this process, so the traced run does the work of the pooled stages in-process
+        # (workers=1) instead of in forked workers, and peak_mb is the memory of the whole stage on one core.
+        state['workers'] = MEMORY_WORKERS
+        tracemalloc.start()
+        stage(state)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        state['workers'] = args.workers
+    return output, {'stage': stage.__name__, 'rows': rows, 'seconds': seconds, 'peak_mb': peak_mb}
+
+### Run
+if not args.no_memory:
+    print(f'Peak memory (MB): tracemalloc of a separate in-process run (workers={MEMORY_WORKERS}), so pooled stages count their workers\' allocations')
+results = []
+for size in sizes:
+    state = {'size': size, 'workers': args.workers}
+    for stage in STAGES:
+        state[stage.__name__], result = measure(stage, state)
+        results.append({'participants': size, **result})
+        print(f"{size:4d} participants  {result['stage']:<20} {result['seconds']:9.3f} s  {result['peak_mb']:9.1f} MB  {result['rows']} rows")
+    del state
+
+results = pd.DataFrame(results)
+results['rows_per_second'] = results['rows'] / results['seconds']
+results.to_csv(args.output + '.csv', index=False)
+environment = {
+    'python': platform.python_version(),
+    'numpy': np.__version__,
+    'pandas': pd.__version__,
+    'platform': platform.platform(),
+    'cpus': os.cpu_count(),
+    'workers': worker_count(args.workers),
+    'condition_seconds': args.condition_seconds,
+    'seed': args.seed,
+    **layout_arguments(args),
+    # peak_mb: tracemalloc peak of a separate run with the pooled stages in-process
+    'memory': None if args.no_memory else f'tracemalloc, in-process run with workers={MEMORY_WORKERS}',
+}
+with open(args.output + '.json', 'w') as file:
+    json.dump({'environment': environment, 'results': results.to_dict(orient='records')}, file, indent=2)
+
+print(results.pivot(index='stage', columns='participants', values='seconds').reindex([stage.__name__ for stage in STAGES]).to_string(float_format='%.3f'))
+
+# Scaling limits / regressions against an earlier run on the same sizes
+if args.baseline:
+    baseline = pd.read_csv(args.baseline)
+    compared = results.merge(baseline, on=['participants', 'stage'], suffixes=('', '_baseline'))
+    compared['ratio'] = compared['seconds'] / compared['seconds_baseline']
+    slower = compared[(compared['ratio'] > 1 + args.tolerance) & (compared['seconds'] - compared['seconds_baseline'] > MINIMUM_REGRESSION_SECONDS)]
+    if len(slower):
+        print(f'Slower than {args.baseline} by more than {args.tolerance:.0%}:')
+        print(slower[['participants', 'stage', 'seconds_baseline', 'seconds', 'ratio']].to_string(index=False))
+        sys.exit(1)
+    print(f'No stage slower than {args.baseline} by more than {args.tolerance:.0%}')
@@ -4,57 +4,20 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
 from statannot import add_stat_annotation
-from scipy.stats import friedmanchisquare
+from questionnaire import add_preference_ranks, long_format, scale_tests
 
 new_data = pd.read_csv(sys.argv[1], delimiter=';')
 
-new_data['Palm7'] = new_data["Please arrange the following reference frames in order of preference (the higher in the list the better):"].apply(lambda x: x.split(';').index('Palm') + 1)
-new_data['Palm w/o Rotation7'] = new_data["Please arrange the following reference frames in order of preference (the higher in the list the better):"].apply(lambda x: x.split(';').index('Palm w/o Rotation') + 1)
-new_data['Path7'] = new_data["Please arrange the following reference frames in order of preference (the higher in the list the better):"].apply(lambda x: x.split(';').index('Path') + 1)
+add_preference_ranks(new_data)
 print(new_data)
 
 dependent_variable = "Preference"
 
-data_df = pd.DataFrame()
-for i in range(len(new_data)):
-    row = new_data.iloc[i]
-    data_df = data_df._append({
-        "Reference Frame": "Palm",
-        "Mental Demand": row["Palm"],
-        "Physical Demand": row["Palm2"],
-        "Temporal Demand": row["Palm3"],
-        "Performance": row["Palm4"],
-        "Effort": row["Palm5"],
-        "Frustration": row["Palm6"],
-        "Preference": row["Palm7"]
-    }, ignore_index=True)
-    data_df = data_df._append({
-        "Reference Frame": "Palm w/o Rotation",
-        "Mental Demand": row["Palm w/o Rotation"],
-        "Physical Demand": row["Palm w/o Rotation2"],
-        "Temporal Demand": row["Palm w/o Rotation3"],
-        "Performance": row["Palm w/o Rotation4"],
-        "Effort": row["Palm w/o Rotation5"],
-        "Frustration": row["Palm w/o Rotation6"],
-        "Preference": row["Palm w/o Rotation7"]
-    }, ignore_index=True)
-    data_df = data_df._append({
-        "Reference Frame": "Path",
-        "Mental Demand": row["Path"],
-        "Physical Demand": row["Path2"],
-        "Temporal Demand": row["Path3"],
-        "Performance": row["Path4"],
-        "Effort": row["Path5"],
-        "Frustration": row["Path6"],
-        "Preference": row["Path7"]
-    }, ignore_index=True)
+# One row per participant x reference frame
+data_df = long_format(new_data)
 
-for i in range(1, 8):
-    palm = "Palm" + (str(i) if i != 1 else "")
-    palmwo = "Palm w/o Rotation" + (str(i) if i != 1 else "")
-    path = "Path" + (str(i) if i != 1 else "")
-    res = friedmanchisquare(new_data[palm], new_data[palmwo], new_data[path])
-    print(res)
+# Friedman and pairwise Wilcoxon tests for every NASA-TLX scale and the preference
+print(scale_tests(new_data).to_string())
 
 sns.set_theme(style="whitegrid")
 ax = sns.boxplot(
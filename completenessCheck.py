@@ -0,0 +1,92 @@
+import sys
+import numpy as np
+import pandas as pd
+from participantLoader import read_log, SELECTION_DTYPES
+
+# Completeness of the selections logs against the study design: every ParticipantID x Movement x
+# ReferenceFrame x TargetSize cell holds SELECTIONS_PER_CELL selections (84 per Movement / ReferenceFrame
+# level and 63 per TargetSize level for one participant). All cells are counted in one cross-tab and
+# every problem is reported, so it can run as a pre-flight check on each file as it arrives.
+
+CELL_COLUMNS = ['ParticipantID', 'Movement', 'ReferenceFrame', 'TargetSize']
+# Target sizes of the study design (m); TargetSize is logged as a number, so it has no fixed categories
+EXPECTED_TARGET_SIZES = [0.02, 0.03, 0.04, 0.05]
+EXPECTED_LEVELS = {'Movement': 3, 'ReferenceFrame': 3, 'TargetSize': len(EXPECTED_TARGET_SIZES)}
+SELECTIONS_PER_CELL = 7
+
+# The expected target sizes and any other size in the data, as numbers or, when TargetSize was cast
+# to str (data-preprocess.py), as strings
+def _target_size_levels(values):
+    found = pd.unique(values[pd.notna(values)])
+    expected = EXPECTED_TARGET_SIZES if np.issubdtype(values.dtype, np.number) else [str(size) for size in EXPECTED_TARGET_SIZES]
+    return pd.Index(sorted(set(expected) | set(found)))
+
+def _codes(column):
+    # Fixed enum categories (participantLoader.CONDITION_DTYPES) and the expected target sizes span the
+    # grid even if a level is never logged; ParticipantID gets its levels from the data
+    if isinstance(column.dtype, pd.CategoricalDtype) and column.name in EXPECTED_LEVELS and column.name != 'TargetSize':
+        return column.cat.codes.to_numpy(), column.cat.categories
+    if column.name == 'TargetSize':
+        values = np.asarray(column)
+        levels = _target_size_levels(values)
+        return levels.get_indexer(values), levels
+    codes, levels = pd.factorize(np.asarray(column), sort=True)
+    return codes, pd.Index(levels)
+
+### Cross-tab
+# Selections per cell over the full grid of levels, including empty cells
+def cell_counts(data):
+    codes, levels = zip(*(_codes(data[column]) for column in CELL_COLUMNS))
+    codes = np.array(codes)
+    assigned = (codes >= 0).all(axis=0)
+    shape = tuple(len(column_levels) for column_levels in levels)
+    flat = np.ravel_multi_index(codes[:, assigned], shape)
+    counts = np.bincount(flat, minlength=int(np.prod(shape)))
+    grid = pd.MultiIndex.from_product(levels, names=CELL_COLUMNS).to_frame(index=False)
+    grid['count'] = counts
+    return grid, int((~assigned).sum())
+
+### Report
+# dict with
+#   cells: every cell whose count differs from SELECTIONS_PER_CELL ('missing' or 'extra' selections)
+#   levels: per factor, levels found vs. EXPECTED_LEVELS, only where they differ
+#   unassigned: rows with an empty ParticipantID / Movement / ReferenceFrame / TargetSize
+def completeness_report(data):
+    grid, unassigned = cell_counts(data)
+    grid['expected'] = SELECTIONS_PER_CELL
+    grid['difference'] = grid['count'] - SELECTIONS_PER_CELL
+    cells = grid[grid['difference'] != 0].reset_index(drop=True)
+    cells['problem'] = np.where(cells['difference'] < 0, 'missing', 'extra')
+
+    levels = {}
+    for column, expected in EXPECTED_LEVELS.items():
+        found = grid.loc[grid['count'] > 0, column].nunique()
+        if found != expected:
+            levels[column] = {'found': found, 'expected': expected}
+    return {'cells': cells, 'levels': levels, 'unassigned': unassigned}
+
+def is_complete(report):
+    return len(report['cells']) == 0 and not report['levels'] and report['unassigned'] == 0
+
+def print_report(report):
+    for column, level in report['levels'].items():
+        print(f"{column}: {level['found']} levels, expected {level['expected']}")
+    if report['unassigned']:
+        print(f"{report['unassigned']} selections without a complete condition")
+    if len(report['cells']):
+        print(f"{len(report['cells'])} cells with missing / more values (expected {SELECTIONS_PER_CELL} selections each):")
+        print(report['cells'].to_string(index=False))
+
+def check_file(path):
+    return completeness_report(read_log(path, CELL_COLUMNS, SELECTION_DTYPES))
+
+# Pre-flight check of one or more selections files: python completenessCheck.py <n>_selections.csv ...
+if __name__ == '__main__':
+    complete = True
+    for path in sys.argv[1:]:
+        report = check_file(path)
+        print(path + (': complete' if is_complete(report) else ':'))
+        if not is_complete(report):
+            print_report(report)
+            complete = False
+    sys.exit(0 if complete else 1)
@@ -31,99 +31,67 @@
 # }
 
 import sys
+import argparse
 import pandas as pd
 import numpy as np
 import math
-import os
-import glob
-data = pd.DataFrame()
-directory = sys.argv[1]
+from conditionIndex import duplicate_runs
+from gaitMetrics import step_frequency, step_frequency_table, study_gait
+from gaitSpectra import spectra_summary, study_spectra, BANDS
+import runReport
+
+parser = argparse.ArgumentParser()
+parser.add_argument('directory')
+parser.add_argument('--speed-profile', type=int, metavar='MS', help='also write per-condition head/path speed in bins of MS milliseconds')
+parser.add_argument('--spectra', action='store_true', help='also write per-condition Welch spectra measures: gait frequency, harmonics and target / palm band power')
+parser.add_argument('--band', nargs=3, action='append', metavar=('NAME', 'LOW', 'HIGH'), help='frequency band in Hz for --spectra (repeatable, replaces the default bands)')
 # Specify the range of participants to include
-participant_start = 5
-participant_end = 28
-for participant_id in range(participant_start - 1, participant_end + 1):
-    file_pattern = os.path.join(directory, f'{participant_id}_highFrequency.csv')
-    files = glob.glob(file_pattern)
-    for file_path in files:
-        if os.path.basename(file_path) == f'{participant_id}_highFrequency.csv':
-            new_data = pd.read_csv(file_path)
-            data = pd.concat([data, new_data], ignore_index=True)
+parser.add_argument('--participants', type=int, nargs=2, metavar=('START', 'END'), default=[5, 28])
+parser.add_argument('--workers', type=int, help='participants processed in parallel (default: all cores)')
+runReport.add_report_arguments(parser)
+args = parser.parse_args()
+report = runReport.from_arguments(args)
+directory = args.directory
+participant_start, participant_end = args.participants
+# Steps, distances, speeds and target distances are computed per participant, one participant per worker
+# process; only the per-condition frames come back
+report.stage('gait')
+study = study_gait(directory, participant_start - 1, participant_end, profile_interval_ms=args.speed_profile, workers=args.workers)
+for name in ['runs', 'steps', 'speeds', 'target_distances']:
+    report.frame(name, study[name])
 pd.set_option('display.max_colwidth', None)
-data['TargetSize'] = data['TargetSize'].astype('category')
-data['ReferenceFrame'] = data['ReferenceFrame'].astype('category')
-data['Movement'] = data['Movement'].astype('category')
-data['CircleDirection'] = data['CircleDirection'].astype('category')
 
 """ grouped = data.groupby(['ParticipantID','Movement', 'ReferenceFrame', 'TargetSize', 'CircleDirection'], dropna=False)
 print(grouped.size().to_string()) """
 
-number_repr = data.copy()
-number_repr['TargetSize'] = number_repr['TargetSize'].cat.codes
-number_repr['ReferenceFrame'] = number_repr['ReferenceFrame'].cat.codes
-number_repr['Movement'] = number_repr['Movement'].cat.codes
-number_repr = number_repr[['ParticipantID', 'Movement', 'ReferenceFrame', 'TargetSize', 'ActiveTargetIndex']]
-number_repr_one = number_repr.iloc[1:].reset_index(drop=True)
-number_repr_two = number_repr.iloc[:-1].reset_index(drop=True)
-changes = (number_repr_one - number_repr_two).where(lambda x: x != 0).dropna(how='all')
-changes.loc[len(data)-1] = number_repr_two.iloc[-1]
-changes = changes != np.nan
-edges = number_repr[changes].dropna()
-
-if edges.shape != edges.drop_duplicates().shape:
+if len(duplicate_runs(study['runs'])):
     print("ERR: There are duplicates, please check the data")
     sys.exit()
 
-targets_head_wp = data[['ParticipantID', 'Movement', 'ReferenceFrame', 'TargetSize', 'HeadPositionX', 'HeadPositionY', 'HeadPositionZ', 'AllTargetsPositionX', 'AllTargetsPositionY', 'AllTargetsPositionZ', 'WalkingDirectionForwardX', 'WalkingDirectionForwardY', 'WalkingDirectionForwardZ']].copy()
-
 # Compute step frequency
 
 # If RealtimeSinceStartupMs is in seconds and not ms, convert to milliseconds
 # data['RealtimeSinceStartupMs'] = data['RealtimeSinceStartupMs']*1000
 
-filtered_data = data[data['Movement'].isin(['Circle', 'Walking'])] # Remove Standing
-local_min_vals = filtered_data.loc[filtered_data['HeadPositionY'] == filtered_data['HeadPositionY'].rolling(10, center=True).min()] # 
-time_between_steps = local_min_vals['SystemClockTimestampMs'].diff().iloc[1:] # reason for iloc: remove first element as it is NaN
-
-# Discard negative time steps. This is to discard "steps" between condition, which are still here as e.g. a minus 4 second step
-filtered_time_between_steps = list(filter(lambda x: 0 <= x, time_between_steps.tolist()))
-mean_time_between_steps_in_seconds = np.mean(filtered_time_between_steps) * 0.001
-mean_step_frequency = 60 / mean_time_between_steps_in_seconds
+report.stage('step frequency')
+condition_steps = study['steps']
+moving_steps = report.filter("Movement in ['Circle', 'Walking']", condition_steps, condition_steps['Movement'].isin(['Circle', 'Walking'])) # Remove Standing
+step_frequencies = step_frequency_table(moving_steps)
+step_frequencies.to_csv(str(participant_start) + "-" + str(participant_end) + "_" + "step_frequency.csv", index=False)
+mean_step_frequency = step_frequency(moving_steps['interval_sum_ms'].sum(), moving_steps['intervals'].sum())
 
-# print(data[['RealtimeSinceStartupMs', 'HeadPositionY']].head(50))
-# print(local_min_vals)
-# print(time_between_steps.head(20))
-# print(filtered_time_between_steps)
+print('\nStep frequency per condition (steps/min):')
+print(step_frequencies.to_string())
 print('\nAverage step frequency:')
 print(mean_step_frequency)
 
 # print(data.head(100))
 
 # Compute distances and speeds
-data['conditionID'] = (data['SystemClockTimestampMs'].diff() <= 0).cumsum()
-grouped_conditions = data.groupby('conditionID')
-data['head_dx'] = data.groupby('conditionID')['HeadPositionX'].diff().fillna(0)
-data['head_dz'] = data.groupby('conditionID')['HeadPositionZ'].diff().fillna(0)
-data['head_distance'] = np.sqrt(data['head_dx']**2 + data['head_dz']**2)
-
-data['path_dx'] = data.groupby('conditionID')['WalkingDirectionPositionX'].diff().fillna(0)
-data['path_dz'] = data.groupby('conditionID')['WalkingDirectionPositionZ'].diff().fillna(0)
-data['path_distance'] = np.sqrt(data['path_dx']**2 + data['path_dz']**2)
-
-result = data.groupby(['conditionID', 'ParticipantID']).agg(
-    movement=('Movement', 'first'),
-    TargetSize=('TargetSize', 'first'),
-    total_head_distance_m=('head_distance', 'sum'),
-    total_path_distance_m=('path_distance', 'sum'),
-    start_time=('RealtimeSinceStartupMs', 'min'),
-    end_time=('RealtimeSinceStartupMs', 'max')
-)
-
-result.insert(4, 'diff_distance', result['total_path_distance_m'] - result['total_head_distance_m'])
-result['total_time_sec'] = (result['end_time'] - result['start_time'])*0.001 # times 0.001 to get seconds
-result['head_speed_km/h'] = (result['total_head_distance_m'] / result['total_time_sec'])*3.6 # times 3.6 to get km/h
-result['path_speed_km/h'] = (result['total_path_distance_m'] / result['total_time_sec'])*3.6 # times 3.6 to get km/h
-
-result = result.drop(columns=['end_time', 'start_time']) # Don't need these anymore
+report.stage('speeds')
+result, speed_profile = study['speeds'], study['speed_profile']
+if speed_profile is not None:
+    speed_profile.to_csv(str(participant_start) + "-" + str(participant_end) + "_" + "speed_profile.csv", index=False)
 
 average_head_speed_by_movement = result.groupby('movement', observed=True)['head_speed_km/h'].mean()
 average_head_speed_by_movement_std = result.groupby('movement', observed=True)['head_speed_km/h'].std() # observed=True to silence warning
@@ -137,13 +105,17 @@ print('Average path speed in Km/h:')
 print(average_path_speed_by_movement.to_string(header=False))
 print(average_path_speed_by_movement_std.to_string(header=False))
 
-targets_head_wp['DistanceVectorX'] = targets_head_wp['AllTargetsPositionX'] - targets_head_wp['HeadPositionX']
-targets_head_wp['DistanceVectorY'] = targets_head_wp['AllTargetsPositionY'] - targets_head_wp['HeadPositionY']
-targets_head_wp['DistanceVectorZ'] = targets_head_wp['AllTargetsPositionZ'] - targets_head_wp['HeadPositionZ']
-targets_head_wp['DotProduct'] = (data[['WalkingDirectionForwardX', 'WalkingDirectionForwardY', 'WalkingDirectionForwardZ']].values * targets_head_wp[['DistanceVectorX', 'DistanceVectorY', 'DistanceVectorZ']].values).sum(axis=1)
-grouped_dot = targets_head_wp.groupby(['ParticipantID', 'ReferenceFrame'], observed=True).agg({'DotProduct': 'mean', "AllTargetsPositionY": "mean"})
-grouped_dot = grouped_dot.rename(columns={'DotProduct': 'ZDistance', 'AllTargetsPositionY': 'FloorDistance'})
+report.stage('target distances')
+grouped_dot = study['target_distances'].copy()
 grouped_dot['ZdistStd'] = grouped_dot['ZDistance']
 grouped_dot['FloorDistStd'] = grouped_dot['FloorDistance']
 grouped_dot = grouped_dot.groupby('ReferenceFrame').agg({'ZdistStd': 'std', 'FloorDistStd': 'std', 'ZDistance': 'mean', 'FloorDistance': 'mean'})
-print(grouped_dot)
\ No newline at end of file
+print(grouped_dot)
+
+if args.spectra:
+    report.stage('spectra')
+    bands = {name: (float(low), float(high)) for name, low, high in args.band} if args.band else BANDS
+    spectra = report.frame('spectra', study_spectra(directory, participant_start - 1, participant_end, bands, workers=args.workers))
+    spectra.to_csv(str(participant_start) + "-" + str(participant_end) + "_" + "spectra.csv", index=False)
+    print('\nSpectral step frequency and target oscillation power per reference frame:')
+    print(spectra_summary(spectra, bands).to_string())
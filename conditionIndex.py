@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+# Run-length index of the high-frequency log. The log is written condition by condition, so every
+# condition (and every active target inside it) is a contiguous block of rows. Instead of hashing
+# millions of rows in groupby, blocks are described by [start, end) row offsets and reduced with
+# numpy's reduceat.
+
+RUN_COLUMNS = ['ParticipantID', 'Movement', 'ReferenceFrame', 'TargetSize', 'ActiveTargetIndex']
+
+def _comparable(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy()
+    return column.to_numpy()
+
+### Runs of identical key columns
+def run_starts(data, columns=RUN_COLUMNS):
+    changed = np.zeros(len(data), dtype=bool)
+    if len(data):
+        changed[0] = True
+    for column in columns:
+        values = _comparable(data[column])
+        changed[1:] |= values[1:] != values[:-1]
+    return np.flatnonzero(changed)
+
+# One row per run: start, end (exclusive, both offset by offset) and the run's key values
+def build_condition_index(data, columns=RUN_COLUMNS, offset=0):
+    starts = run_starts(data, columns)
+    ends = np.append(starts[1:], len(data))
+    index = pd.DataFrame({'start': starts + offset, 'end': ends + offset})
+    for column in columns:
+        index[column] = np.asarray(data[column])[starts]
+    return index
+
+# Joins runs split over several index tables (e.g. chunk borders) back into one run each
+def coalesce_runs(index, columns=RUN_COLUMNS):
+    if len(index) == 0:
+        return index
+    index = index.reset_index(drop=True)
+    same_key = index[columns].eq(index[columns].shift()).all(axis=1).to_numpy()
+    contiguous = index['start'].to_numpy() == index['end'].shift().to_numpy()
+    new_run = ~(same_key & contiguous)
+    first = np.flatnonzero(new_run)
+    last = np.append(first[1:] - 1, len(index) - 1)
+    coalesced = index.iloc[first].reset_index(drop=True)
+    coalesced['end'] = index['end'].to_numpy()[last]
+    return coalesced
+
+# The same key appearing in more than one run means a condition was logged twice
+def duplicate_runs(index, columns=RUN_COLUMNS):
+    return index[index.duplicated(columns, keep=False)]
+
+### Conditions by timestamp
+# SystemClockTimestampMs restarts with every condition, so a non-increasing step starts a new one
+def timestamp_segments(timestamps):
+    timestamps = np.asarray(timestamps)
+    return np.concatenate(([0], np.flatnonzero(np.diff(timestamps) <= 0) + 1)) if len(timestamps) else np.zeros(0, dtype=np.int64)
+
+def segment_lengths(starts, length):
+    return np.diff(np.append(starts, length))
+
+def segment_ids(starts, length):
+    return np.repeat(np.arange(len(starts)), segment_lengths(starts, length))
+
+### Offset-based reductions (segments must be non-empty, starts strictly increasing)
+def segment_sum(values, starts):
+    return np.add.reduceat(np.asarray(values), starts)
+
+def segment_min(values, starts):
+    return np.minimum.reduceat(np.asarray(values), starts)
+
+def segment_max(values, starts):
+    return np.maximum.reduceat(np.asarray(values), starts)
+
+def segment_first(values, starts):
+    return np.asarray(values)[starts]
+
+# NaN-skipping mean, like groupby().mean()
+def segment_mean(values, starts):
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.add.reduceat(np.where(valid, values, 0), starts) / np.add.reduceat(valid, starts)
+
+# Difference to the previous row of the same segment; the first row of every segment gets fill
+def segment_diff(values, starts, fill=0):
+    values = np.asarray(values)
+    diff = np.empty(len(values), dtype=np.result_type(values.dtype, np.float32))
+    diff[1:] = values[1:] - values[:-1]
+    diff[starts] = fill
+    return diff
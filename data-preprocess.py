@@ -1,14 +1,20 @@
 #0. Import data.
 import sys
+import argparse
 import pandas as pd
 import numpy as np
 import scipy.stats as st
 import math
-import glob
-import os
 import matplotlib.pyplot as plt
 import seaborn as sns
 from statannot import add_stat_annotation
+from fittsMetrics import condition_throughput, study_selections, sweep_summary, throughput_sweep
+from normalityTests import non_normal_counts, normality_table
+from artBatch import art_batch, contrast_table, parse_contrast
+from sphericityTests import sphericity_table
+from figureRenderer import box_plot, figure_name, render_box_plots, render_outlier_scatter, FACTOR_ORDERS, FACTOR_TICKS
+from completenessCheck import completeness_report, is_complete, print_report
+import runReport
 
 # write to file
 def export_csv(data, name):
@@ -16,8 +22,6 @@ def export_csv(data, name):
 
 
 
-data = pd.DataFrame()
-
 # Old import method
 # for arg in sys.argv:
 #     if arg == sys.argv[0]:
@@ -27,19 +31,30 @@ data = pd.DataFrame()
 #     data = pd.concat([data, new_data], ignore_index=True)
 
 # New import method
+parser = argparse.ArgumentParser()
 # Download data from onedrive and set the directory containing the CSV files
-directory = sys.argv[1]
+parser.add_argument('directory')
 # Specify the range of participants to include
-participant_start = 5
-participant_end = 28
-for participant_id in range(participant_start, participant_end + 1):
-    file_pattern = os.path.join(directory, f'{participant_id}_selections.csv')
-    files = glob.glob(file_pattern)
-    for file_path in files:
-        if os.path.basename(file_path) == f'{participant_id}_selections.csv':
-            print(f'Processing participant {participant_id}')
-            new_data = pd.read_csv(file_path)
-            data = pd.concat([data, new_data], ignore_index=True)
+parser.add_argument('--participants', type=int, nargs=2, metavar=('START', 'END'), default=[5, 28])
+parser.add_argument('--recompute', action='store_true', help='ignore cached per-participant results')
+parser.add_argument('--dependent-variables', metavar='FILE', help='output of computeDependentVariables.py to merge (default: <START>-<END>_additional_dependent_variables.csv)')
+parser.add_argument('--workers', type=int, help='processes for the normality tests, --art-batch and --figures (default: all cores)')
+parser.add_argument('--figures', metavar='DIR', help='render the box plots of every dependent variable in dependent_names into DIR, then exit')
+parser.add_argument('--art-batch', action='store_true', help='run ART for every dependent variable in dependent_names and every contrast, then exit')
+# Outlier sensitivity analysis: per-condition throughput for every cutoff on b, then exit
+parser.add_argument('--outlier-sweep', type=float, nargs='+', default=[], metavar='M', help='absolute cutoffs on b in m')
+parser.add_argument('--sweep-mad', type=float, nargs='+', default=[], metavar='K', help='per-condition cutoffs median + K * MAD')
+parser.add_argument('--sweep-iqr', type=float, nargs='+', default=[], metavar='K', help='per-condition cutoffs Q3 + K * IQR')
+parser.add_argument('--sweep-sd', type=float, nargs='+', default=[], metavar='K', help='per-condition cutoffs mean + K * SD')
+runReport.add_report_arguments(parser)
+args = parser.parse_args()
+report = runReport.from_arguments(args)
+directory = args.directory
+participant_start, participant_end = args.participants
+# Per-selection b, a, c, dx and ae are computed per participant (fittsMetrics.add_selection_metrics, step 1 below)
+# and cached, so only new or changed participants are processed
+report.stage('load selections')
+data = report.frame('selections', study_selections(directory, participant_start, participant_end, recompute=args.recompute, verbose=True))
 
 pd.set_option('display.max_colwidth', None)
 
@@ -56,49 +71,22 @@ data['TargetSize'] = data['TargetSize'].astype(str)
 print(grouped.size().to_string()) """
 
 def missing_values():
-    grouped = data.groupby(['ParticipantID','Movement', 'ReferenceFrame', 'TargetSize'])
+    grouped = data.groupby(['ParticipantID','Movement', 'ReferenceFrame', 'TargetSize'], observed=True)
     print(grouped.size().to_string())
 
-grouped_by_movement = data.groupby(['Movement'])
-if len(grouped_by_movement.size()) != 3:
-    print('There are not all three types of movements')
-    missing_values()
-    sys.exit(1)
-if grouped_by_movement.filter(lambda x: len(x) % 84 != 0).shape[0] > 0:
-    print('There are missing / more values (Movement)')
-    missing_values()
-    sys.exit(1)
-grouped_by_reference_frame = data.groupby(['ReferenceFrame'])
-if len(grouped_by_reference_frame.size()) != 3:
-    print('There are not all three types of reference frames')
-    missing_values()
-    sys.exit(1)
-if grouped_by_reference_frame.filter(lambda x: len(x) % 84 != 0).shape[0] > 0:
-    print('There are missing / more values (ReferenceFrame)')
-    missing_values()
-    sys.exit(1)
-grouped_by_target_size = data.groupby(['TargetSize'])
-if len(grouped_by_target_size.size()) != 4:
-    print('There are not all four types of target sizes')
+# Every ParticipantID x Movement x ReferenceFrame x TargetSize cell must hold 7 selections
+# (84 per Movement / ReferenceFrame level, 63 per TargetSize level); all problems are reported at once
+report.stage('completeness')
+completeness = completeness_report(data)
+if not is_complete(completeness):
+    print('There are missing / more values')
+    print_report(completeness)
     missing_values()
     sys.exit(1)
-if grouped_by_target_size.filter(lambda x: len(x) % 63 != 0).shape[0] > 0:
-    print('There are missing / more values (TargetSize)')
-    missing_values()
-    sys.exit(1)
-
-# Apply the function to each row
-data['b'] = np.sqrt((data['AbsoluteTargetPositionX'] - data['AbsoluteSelectionPositionX'])**2 + (data['AbsoluteTargetPositionY'] - data['AbsoluteSelectionPositionY'])**2)
 
 #1. Apply the equations for the per-row calculation of dx & ae from the 'First_2_Pilots.xlsx' file to the data you have
 
-def change(row_name_prev, row_name_curr):
-    return data[row_name_curr] - data[row_name_prev].shift(1, fill_value=data[row_name_curr][0])
-
-data['a'] = np.sqrt((change("AbsoluteTargetPositionX","AbsoluteTargetPositionX"))**2 + (change("AbsoluteTargetPositionY","AbsoluteTargetPositionY"))**2)
-data['c'] = np.sqrt((change("AbsoluteTargetPositionX","AbsoluteSelectionPositionX"))**2 + (change("AbsoluteTargetPositionY","AbsoluteSelectionPositionY"))**2)
-data['dx'] = (data['c'] * data['c'] - data['b'] * data['b'] - data['a'] * data['a']) / (2.0 * data['a'])
-data['ae'] = data['a'] + data['dx']
+# Done per participant and condition block when loading (fittsMetrics.add_selection_metrics): b, a, c, dx and ae
 #print(data.head())
 #print(data.shape)
 data["b-bigger-dx"] = data["dx"] > np.abs(data["dx"])
@@ -115,24 +103,27 @@ data["b-bigger-dx"] = data["dx"] > np.abs(data["dx"])
 
 #4. Filter using the 'Data' tab in Excel and delete the rows where the 'SelectionDuration' value equals 0 (that is the first selection and as a result an idle selection)
 
-data = data[data['SelectionDuration'] != 0]
+report.stage('outliers')
+data = report.filter('SelectionDuration != 0', data, data['SelectionDuration'] != 0)
 #data = data[data['ReferenceFrame'] != 'PalmWORotation']
 
-plt.scatter(data['b'], data['SelectionDuration'], c=data['b'] < 0.08 )
-ax = plt.gca()
-ax.set_xlabel('Distance (m)')
-ax.set_ylabel('Movement Time (ms)')
-fig = plt.gcf()
-plt.subplots_adjust(left=0.25, right=0.9, top=0.95, bottom=0.15)
-fig.set_size_inches(3, 3.5)
-fig.savefig('outliers.png', dpi=100)
-plt.close()
+# Redrawn only when the selections changed
+render_outlier_scatter(data, 'outliers.png', 0.08)
+
+if args.outlier_sweep or args.sweep_mad or args.sweep_iqr or args.sweep_sd:
+    report.stage('outlier sweep')
+    sweep = throughput_sweep(data, args.outlier_sweep, args.sweep_mad, args.sweep_iqr, args.sweep_sd)
+    export_csv(sweep, "outlier_sweep.csv")
+    summary = sweep_summary(sweep)
+    export_csv(summary, "outlier_sweep_summary.csv")
+    print(summary.to_string())
+    sys.exit(0)
 
 #print((data['b'] > 0.1).value_counts())
 #print((data['b'] > 0.09).value_counts())
 print((data['b'] > 0.08).value_counts())
 #print((data['b'] > (data['b'].mean() + 2* data['b'].std())).value_counts())
-data = data[data['b'] < 0.08]
+data = report.filter('b < 0.08', data, data['b'] < 0.08)
 #print(len(data))
 
 
@@ -147,17 +138,12 @@ data = data.rename(columns={'SelectionDuration': 'MT'})
 
 #7. Calculate average SuccessRate, MT / 1000 to convert from ms to s, and Ae, and standard deviation of dx (SDx) and delete all the 'smth.1-7' columns
 export_csv(data, "preprocessed_each.csv")
-data = data.groupby(['ParticipantID', 'Movement', 'CircleDirection', 'ReferenceFrame', 'TargetSize'], dropna=False).agg({'Success': 'mean', 'MT': 'mean', 'dx': 'std', 'ae': 'mean', 'b': 'mean'}).reset_index()
-data['MT'] = data['MT'] / 1000
-data['SDx'] = data['dx']
 
 #8. Calculate IDe, TP and WeCM = We * 100 (because it's in meters) as described here (https://www.yorku.ca/mack/hhci2018.html, Figure 17.7)
 
-data['WeCM']  = data['dx']*4.133*100
-data['IDe'] = np.log2(data['ae']*100/data['WeCM'] + 1)
-data['TP'] = data['IDe']/data['MT']
-data["DistanceCM"] = data["b"] * 100
-data = data.drop(['b',"dx"], axis=1)
+# Both steps in one grouped reduction: fittsMetrics.condition_throughput
+report.stage('throughput')
+data = report.frame('throughput', condition_throughput(data, duration='MT'))
 
 # import matplotlib.pyplot as plt
 # Scatter plot of IDe vs MT
@@ -172,8 +158,9 @@ data = data.drop(['b',"dx"], axis=1)
 #9. Deal with reference frame naming (Hand-Referenced, position only -> HandRefPos; Hand-Referenced -> HandRef; Path-Referenced, Simulated Torso -> PathRefNeck; Path-Referenced -> PathRef)
 
 # This is already done in the data
+report.stage('wide format')
 data_art = data.copy()
-grouped_for_stats = data_art.groupby(['ReferenceFrame', "Movement"]).agg({'Success': 'mean', 'MT': 'mean', 'DistanceCM': 'mean', 'SDx': 'std', 'ae': 'mean', 'WeCM': 'mean', 'IDe': 'mean', 'TP': 'mean'})
+grouped_for_stats = data_art.groupby(['ReferenceFrame', "Movement"], observed=True).agg({'Success': 'mean', 'MT': 'mean', 'DistanceCM': 'mean', 'SDx': 'std', 'ae': 'mean', 'WeCM': 'mean', 'IDe': 'mean', 'TP': 'mean'})
 #print(grouped_for_stats.to_string())
 grouped_for_stats = data_art
 grouped_for_stats['Success_STD'] = grouped_for_stats['Success']
@@ -186,23 +173,31 @@ original_size = len(grouped_for_stats)
 #10. Convert data to wide format again but now with the following parameters: Identifier = ParticpantID, Index Vars = all conditions
 
 data = data.drop(["CircleDirection"], axis=1)
-data = data.pivot_table(index=['ParticipantID'], columns=['Movement', 'ReferenceFrame', 'TargetSize']).reset_index()
+data = data.pivot_table(index=['ParticipantID'], columns=['Movement', 'ReferenceFrame', 'TargetSize'], observed=True).reset_index()
 
 data.columns = ['_'.join(col).strip() for col in data.columns.values]
 data.rename(columns={'ParticipantID___': 'ParticipantID'}, inplace=True)
 
 #----------
-# Append the extra dependent variables
-new_data = pd.read_csv('5-28_additional_dependent_variables.csv')
+# Append the extra dependent variables (computeDependentVariables.py run over the same participants)
+new_data = pd.read_csv(args.dependent_variables or str(participant_start) + "-" + str(participant_end) + "_" + "additional_dependent_variables.csv")
 new_data['TargetSize'] = new_data['TargetSize'].astype(str)
 # Merge additional dependent variables into data_art
 data_art = pd.merge(data_art, new_data, on=['ParticipantID', 'Movement', 'ReferenceFrame', 'TargetSize'], how='left')
 export_csv(data, "preprocessed.csv")
 export_csv(data_art, "preprocessed_art.csv")
-
-from scipy.stats import shapiro
-shapiro_test = data_art.groupby(['Movement', 'ReferenceFrame', 'TargetSize']).agg({'Success': lambda x: shapiro(x)[1], 'MT': lambda x: shapiro(x)[1], 'DistanceCM': lambda x: shapiro(x)[1], 'SDx': lambda x: shapiro(x)[1], 'ae': lambda x: shapiro(x)[1], 'WeCM': lambda x: shapiro(x)[1], 'IDe': lambda x: shapiro(x)[1], 'TP': lambda x: shapiro(x)[1]})
-shapiro_count = shapiro_test.map(lambda x: x < 0.05).sum()
+report.frame('wide', data)
+report.frame('art', data_art)
+
+# Fitts' law measures and the additional dependent variables merged above
+NORMALITY_VARIABLES = ['Success', 'MT', 'DistanceCM', 'SDx', 'ae', 'WeCM', 'IDe', 'TP', 'ParticipantHeight', 'Decline', 'Depth', 'LateralShift',
+                       'DeclineAngle', 'LateralShiftAngle', 'RelativeTargetPitch', 'RelativeTargetYaw', 'DeclineDiff', 'DepthDiff']
+
+# Shapiro-Wilk, skewness and kurtosis per condition for every dependent variable, in a worker pool
+report.stage('normality')
+normality = normality_table(data_art, NORMALITY_VARIABLES, workers=args.workers)
+export_csv(normality, "normality.csv")
+shapiro_count = non_normal_counts(normality)
 print(shapiro_count)
 
 
@@ -246,15 +241,34 @@ dependent_measurements = {
     'DeclineDiff': 'm',
     'RelativeTargetYaw': 'degrees',
 }
-refFrameOrder = ['PalmReferenced','PalmWORotation','PathReferenced']
-refFrameTicks = ['Palm','PalmWOR','Path']
-movementOrder = ['Standing','Walking','Circle']
-movementTicks = ['Standing','Linear','Circular']
-targetSizeOrder = ['0.02','0.03','0.04','0.05']
-targetSizeTicks = ['2cm','3cm','4cm','5cm']
+refFrameOrder = FACTOR_ORDERS['ReferenceFrame']
+refFrameTicks = FACTOR_TICKS['ReferenceFrame']
+movementOrder = FACTOR_ORDERS['Movement']
+movementTicks = FACTOR_TICKS['Movement']
+targetSizeOrder = FACTOR_ORDERS['TargetSize']
+targetSizeTicks = FACTOR_TICKS['TargetSize']
 order = refFrameOrder if factors[0] == 'ReferenceFrame' else movementOrder if factors[0] == 'Movement' else targetSizeOrder
 ticks = refFrameTicks if factors[0] == 'ReferenceFrame' else movementTicks if factors[0] == 'Movement' else targetSizeTicks
 
+# Batch mode: every dependent variable x every main effect and interaction, one R session per worker
+if args.art_batch:
+    report.stage('art batch')
+    art = art_batch(data_art, list(dependent_names), workers=args.workers)
+    export_csv(art['anova'], "art_anova.csv")
+    export_csv(art['contrasts'], "art_contrasts.csv")
+    with open(str(participant_start) + "-" + str(participant_end) + "_" + "art_contrasts.tex", 'w') as file:
+        for (name, term), table in art['latex'].items():
+            file.write('% ' + dependent_names[name] + ': ' + term + '\n' + table + '\n')
+    sys.exit(0)
+
+# Batch figures: every dependent variable x factor and factor pair, headless, unchanged figures skipped
+if args.figures:
+    report.stage('figures')
+    rendered = render_box_plots(data_art, list(dependent_names), args.figures,
+                                {name: dependent_names[name] + ' (' + dependent_measurements[name] + ')' for name in dependent_names}, workers=args.workers)
+    print(f'{len(rendered)} figures rendered into {args.figures}')
+    sys.exit(0)
+
 tp_dependent = data_art[['ParticipantID', 'Movement', 'ReferenceFrame', 'TargetSize', dependent_variable]].copy()
 tp_dependent["Movement"] = tp_dependent["Movement"].astype('category')
 tp_dependent["ReferenceFrame"] = tp_dependent["ReferenceFrame"].astype('category')
@@ -262,20 +276,16 @@ tp_dependent["TargetSize"] = tp_dependent["TargetSize"].astype('category')
 tp_dependent["ParticipantID"] = tp_dependent["ParticipantID"].apply(str)
 tp_dependent["ParticipantID"] = tp_dependent["ParticipantID"].astype('category')
 
-import pingouin as pg
-spher, _, chisq, dof, pval = pg.sphericity(tp_dependent, dv=dependent_variable,
-                                           subject='ParticipantID',
-                                           within=['TargetSize'])
-print("Sphericity test TargetSize: ", spher)
-spher, _, chisq, dof, pval = pg.sphericity(tp_dependent, dv=dependent_variable,
-                                             subject='ParticipantID',
-                                             within=['Movement'])
-print("Sphericity test Movement: ", spher)
-spher, _, chisq, dof, pval = pg.sphericity(tp_dependent, dv=dependent_variable,
-                                                subject='ParticipantID',
-                                                within=['ReferenceFrame'])
-print("Sphericity test ReferenceFrame: ", spher)
+# Mauchly's test for every within factor and dependent variable from one pivot
+report.stage('sphericity')
+sphericity = sphericity_table(data_art, NORMALITY_VARIABLES, factors=['TargetSize', 'Movement', 'ReferenceFrame'])
+export_csv(sphericity, "sphericity.csv")
+for factor in ['TargetSize', 'Movement', 'ReferenceFrame']:
+    spher = sphericity.loc[(sphericity['DependentVariable'] == dependent_variable) & (sphericity['Effect'] == factor), 'Sphericity'].iloc[0]
+    print("Sphericity test " + factor + ": ", spher)
 
+# R round trip: data transfer, ART model, contrasts and back
+report.stage('art')
 import rpy2.robjects.packages as rpackages
 import rpy2.robjects as ro
 from rpy2.robjects import pandas2ri
@@ -306,48 +316,17 @@ ro_con= f(r_from_pd_df)
 with (ro.default_converter + pandas2ri.converter).context():
     df_con = ro.conversion.rpy2py(ro_con)
 
-df_con["contrast"] = df_con["contrast"].str.replace("TargetSize", "")
-df_con["contrast"] = df_con["contrast"].str.split("-", n=1, expand=False)
-if len(factors) == 1:
-    df_con["contrast"] = df_con["contrast"].apply(lambda x: (x[0].strip(), x[1].strip()))
-else:
-    df_con["contrast"] = df_con["contrast"].apply(lambda x: (tuple(x[0].strip().split(",")), tuple(x[1].strip().split(","))))
+df_con["contrast"] = df_con["contrast"].apply(lambda contrast: parse_contrast(contrast, len(factors)))
 
-df_table = df_con.copy()
+df_table = contrast_table(df_con, len(factors))
 df_con = df_con[df_con["p.value"] < 0.05]
-df_table[["contrast 1", "contrast 2"]] = pd.DataFrame(df_table['contrast'].to_list(), index=df_table.index)
-df_table = df_table.drop(['contrast'], axis=1)
-df_table[["contrast1 factor1", "contrast1 factor2"]] = pd.DataFrame(df_table['contrast 1'].to_list(), index=df_table.index)
-df_table[["contrast2 factor1", "contrast2 factor2"]] = pd.DataFrame(df_table['contrast 2'].to_list(), index=df_table.index)
-df_table = df_table.drop(['contrast 1', 'contrast 2'], axis=1)
-df_table = df_table[['contrast1 factor1', 'contrast1 factor2', 'contrast2 factor1', 'contrast2 factor2', 'p.value']]
-df_table = df_table.rename(columns={'p.value': 'p-value', 'contrast1 factor1': 'Factor-pair 1 (1)', 'contrast1 factor2': 'Factor-pair 1 (2)', 'contrast2 factor1': 'Factor-pair 2 (1)', 'contrast2 factor2': 'Factor-pair 2 (2)'})
-df_table['p-value'] = df_table['p-value'].apply(lambda x: str(x)[:5] if x >= 0.05 else str(x)[:5] + " \cellcolor[HTML]{C0C0C0}" if x >= 0.001 else "<0.001 \cellcolor[HTML]{C0C0C0}" )
 print(df_table.to_latex(index=False))
 #print(df_con["contrast"].to_list())
-grouped_for_stats = grouped_for_stats.groupby(factors).agg({'Success': 'mean', 'Success_STD': 'std', 'MT': 'mean', 'MT_STD': 'std', 'WeCM': 'mean', 'WeCM_STD': 'std', 'IDe': 'mean', 'IDe_STD': 'std', 'TP': 'mean', 'TP_STD': 'std'})
+report.stage('descriptive statistics')
+grouped_for_stats = grouped_for_stats.groupby(factors, observed=True).agg({'Success': 'mean', 'Success_STD': 'std', 'MT': 'mean', 'MT_STD': 'std', 'WeCM': 'mean', 'WeCM_STD': 'std', 'IDe': 'mean', 'IDe_STD': 'std', 'TP': 'mean', 'TP_STD': 'std'})
 new_size = len(grouped_for_stats)
 print(grouped_for_stats.to_string())
 
-sns.set_theme(style="whitegrid")
-ax = sns.boxplot(
-    data=data_art, 
-    x=factors[0], 
-    y=dependent_variable,
-    order=order,
-    hue=factors[1] if len(factors) == 2 else None,
-    hue_order=None if len(factors) == 1 else refFrameOrder if factors[1] == 'ReferenceFrame' else movementOrder if factors[1] == 'Movement' else targetSizeOrder,
-    whis=(0, 100),
-    showmeans=True,
-    meanprops=dict(marker='x', markerfacecolor='black', markeredgecolor='black')
-)
-ax.set_xticklabels(ticks)
-ax.set_ylabel(dependent_names[dependent_variable] + ' ('+dependent_measurements[dependent_variable]+')')
-if len(factors) == 2:
-    ticks = refFrameTicks if factors[1] == 'ReferenceFrame' else movementTicks if factors[1] == 'Movement' else targetSizeTicks
-    for t in ticks:
-        ax.legend_.texts[ticks.index(t)].set_text(t)
-    ax.legend(bbox_to_anchor=(0.1, 1))
 def pairs(x):
     return [(a, b) for idx, a in enumerate(x) for b in x[idx + 1:]]
 
@@ -383,14 +362,9 @@ else:
     line_height=0.005 if len(factors) == 2 else 0.02, 
     text_offset=-7 if len(factors) == 2 else 1
 ) """
-fig = plt.gcf()
-if len(factors) == 1:
-    fig.set_size_inches(3, 3.5)
-else:
-    fig.set_size_inches(6, 4)
-plt.subplots_adjust(left=0.25, right=0.9, top=0.95, bottom=0.15)
-fig.savefig(dependent_variable + '_'+factors[0] +'_'+(factors[1] if len(factors) == 2 else "")+'.png', dpi=100)
-plt.show()
+report.stage('box plot')
+box_plot(data_art, dependent_variable, factors, figure_name(dependent_variable, factors),
+         dependent_names[dependent_variable] + ' ('+dependent_measurements[dependent_variable]+')')
 
 #4. Rename columns as such: ART(Effort) for Movement -> Effort_M, ART(Effort) for Movement*ReferenceFrame-> Effort_MxR, ART-C(Effort) for Movement -> Effort-C_M, etc.
 #5. Combine all output files (only relevant columns) incl. contrasts into one file in long format
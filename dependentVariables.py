@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+import resultCache
+from participantLoader import iter_log_chunks, map_participants, participant_files, read_log, HIGH_FREQUENCY, HIGH_FREQUENCY_DTYPES
+from conditionIndex import build_condition_index, coalesce_runs
+from targetGeometry import add_target_geometry, add_relative_target_angles
+
+# Per-condition dependent variables of computeDependentVariables.py (additional_dependent_variables.csv).
+# Means are built from running count / sum / sum of squares per condition, so the same code serves the
+# in-memory run (one block) and the streaming run (one block per chunk).
+
+CONDITION_KEYS = ['ParticipantID', 'ReferenceFrame', 'Movement', 'TargetSize']
+MEAN_COLUMNS = ['ParticipantHeight', 'Decline', 'Depth', 'LateralShift', 'DeclineAngle', 'LateralShiftAngle', 'RelativeTargetPitch', 'RelativeTargetYaw']
+
+HIGH_FREQUENCY_COLUMNS = [
+    'ParticipantID', 'Movement', 'CircleDirection', 'ReferenceFrame', 'TargetSize', 'ActiveTargetIndex', 'SystemClockTimestampMs',
+    'HeadPositionX', 'HeadPositionY', 'HeadPositionZ', 'TrackPositionY', 'WalkingDirectionForwardX', 'WalkingDirectionForwardZ',
+    'AllTargetsPositionX', 'AllTargetsPositionY', 'AllTargetsPositionZ', 'AllTargetsForwardX', 'AllTargetsForwardY', 'AllTargetsForwardZ',
+]
+
+# float32 computes the relative target angles in single precision, for less memory on large logs
+def add_dependent_variables(data, float32=False):
+    add_target_geometry(data)
+    add_relative_target_angles(data, float32=float32)
+    return data
+
+def _plain_keys(frame):
+    # Chunks carry their own categories; compare and merge keys by value
+    for key in CONDITION_KEYS:
+        if isinstance(frame[key].dtype, pd.CategoricalDtype):
+            frame[key] = np.asarray(frame[key])
+    return frame
+
+### Running sums
+# One row per condition with <column>_count (non-NaN rows), <column>_sum and <column>_sumsq
+def condition_sums(data):
+    values = data[MEAN_COLUMNS].astype('float64')
+    frame = pd.concat([
+        data[CONDITION_KEYS],
+        values.notna().add_suffix('_count'),
+        values.add_suffix('_sum'),
+        (values * values).add_suffix('_sumsq'),
+    ], axis=1)
+    return _plain_keys(frame.groupby(CONDITION_KEYS, observed=True, sort=False).sum().reset_index())
+
+def merge_sums(accumulator, sums):
+    if accumulator is None:
+        return sums
+    return pd.concat([accumulator, sums], ignore_index=True).groupby(CONDITION_KEYS, sort=False).sum().reset_index()
+
+def condition_means(sums):
+    result = sums[CONDITION_KEYS].copy()
+    for column in MEAN_COLUMNS:
+        result[column] = sums[column + '_sum'] / sums[column + '_count'].replace(0, np.nan)
+    return result
+
+def condition_variances(sums):
+    result = sums[CONDITION_KEYS].copy()
+    for column in MEAN_COLUMNS:
+        count = sums[column + '_count'].replace(0, np.nan)
+        mean = sums[column + '_sum'] / count
+        result[column] = (sums[column + '_sumsq'] - count * mean * mean) / (count - 1)
+    return result
+
+### Path-referenced baseline and final table
+def path_means(sums):
+    path = sums[sums['ReferenceFrame'] == 'PathReferenced'].groupby('ParticipantID')[
+        ['Decline_sum', 'Decline_count', 'Depth_sum', 'Depth_count']].sum()
+    return pd.DataFrame({
+        'ParticipantID': path.index,
+        'Path_mean_decline': (path['Decline_sum'] / path['Decline_count']).values,
+        'Path_mean_depth': (path['Depth_sum'] / path['Depth_count']).values,
+    })
+
+def dependent_variables_table(sums):
+    result = condition_means(sums).sort_values(CONDITION_KEYS).reset_index(drop=True)
+    result = result.merge(path_means(sums), on='ParticipantID', how='left')
+    result['DeclineDiff'] = result['Decline'] - result['Path_mean_decline']
+    result['DepthDiff'] = result['Depth'] - result['Path_mean_depth']
+    return result
+
+### Per participant
+# Bump when the per-participant computation changes, so cached results are recomputed
+PIPELINE_VERSION = 1
+
+# (condition sums, condition run index) of one participant's log. With chunk_size the log is read in
+# chunks and memory is bounded by chunk_size rather than by the log size.
+def participant_dependent_variables(path, chunk_size=None, float32=False):
+    if chunk_size is None:
+        data = read_log(path, HIGH_FREQUENCY_COLUMNS, HIGH_FREQUENCY_DTYPES, cache=True)
+        return condition_sums(add_dependent_variables(data, float32)), build_condition_index(data)
+    sums = None
+    runs = []
+    rows = 0
+    for chunk in iter_log_chunks(path, chunk_size, HIGH_FREQUENCY_COLUMNS, HIGH_FREQUENCY_DTYPES):
+        runs.append(build_condition_index(chunk, offset=rows))
+        rows += len(chunk)
+        sums = merge_sums(sums, condition_sums(add_dependent_variables(chunk, float32)))
+    # Runs cut by a chunk border are joined again, so the run table matches an in-memory build
+    return sums, coalesce_runs(pd.concat(runs, ignore_index=True))
+
+def _cached_participant(args):
+    path, chunk_size, recompute, float32 = args
+    # Single and double precision results are cached separately
+    stage = 'dependent_variables_float32' if float32 else 'dependent_variables'
+    return resultCache.load_or_compute(stage, PIPELINE_VERSION, path,
+                                       lambda log_path: participant_dependent_variables(log_path, chunk_size, float32), recompute=recompute)
+
+### Study
+# Per-participant results come from resultCache when the log is unchanged; only new or changed
+# participants are computed (streamed and in-memory runs give the same result and share entries).
+# Participants are fanned out to `workers` processes (participantLoader.map_participants); each returns
+# only its condition sums and run index, which are reduced here in participant order.
+# Returns the merged condition sums and run index of all participants.
+def study_dependent_variables(directory, participant_start, participant_end, chunk_size=None, recompute=False, workers=None, float32=False):
+    paths = participant_files(directory, HIGH_FREQUENCY, participant_start, participant_end)
+    results = map_participants(_cached_participant, [(path, chunk_size, recompute, float32) for _, path in paths], workers)
+    sums = None
+    for participant_sums, _ in results:
+        sums = merge_sums(sums, participant_sums)
+    return sums, pd.concat([participant_runs for _, participant_runs in results], ignore_index=True)
@@ -0,0 +1,129 @@
+import os
+import hashlib
+from itertools import combinations
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+import logCache
+from participantLoader import map_participants
+
+# Headless figures of data-preprocess.py: box plots of every dependent variable x factor (and factor pair)
+# rendered with the Agg backend over a process pool. A figure is only redrawn when the hash of its input
+# data or its settings changed (hashes kept in FIGURE_HASHES inside the output directory).
+
+FIGURE_HASHES = '.figure_hashes.json'
+# Bump when the drawing code changes, so all figures are redrawn
+RENDERER_VERSION = 1
+
+FACTOR_ORDERS = {
+    'ReferenceFrame': ['PalmReferenced', 'PalmWORotation', 'PathReferenced'],
+    'Movement': ['Standing', 'Walking', 'Circle'],
+    'TargetSize': ['0.02', '0.03', '0.04', '0.05'],
+}
+FACTOR_TICKS = {
+    'ReferenceFrame': ['Palm', 'PalmWOR', 'Path'],
+    'Movement': ['Standing', 'Linear', 'Circular'],
+    'TargetSize': ['2cm', '3cm', '4cm', '5cm'],
+}
+FIGURE_FACTORS = ['Movement', 'ReferenceFrame', 'TargetSize']
+
+def figure_name(dependent_variable, factors):
+    return dependent_variable + '_' + factors[0] + '_' + (factors[1] if len(factors) == 2 else "") + '.png'
+
+def data_hash(data, settings):
+    digest = hashlib.sha256(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    digest.update(repr((RENDERER_VERSION, settings)).encode())
+    return digest.hexdigest()
+
+### Drawing
+# Box plot of y over factors[0], split by factors[1] if given; ylabel e.g. 'Throughput (bits/sec)'
+def box_plot(data, y, factors, path, ylabel=None, orders=FACTOR_ORDERS, ticks=FACTOR_TICKS):
+    plt.switch_backend('Agg')
+    sns.set_theme(style="whitegrid")
+    fig, ax = plt.subplots()
+    sns.boxplot(
+        data=data,
+        x=factors[0],
+        y=y,
+        order=orders.get(factors[0]),
+        hue=factors[1] if len(factors) == 2 else None,
+        hue_order=orders.get(factors[1]) if len(factors) == 2 else None,
+        whis=(0, 100),
+        showmeans=True,
+        meanprops=dict(marker='x', markerfacecolor='black', markeredgecolor='black'),
+        ax=ax,
+    )
+    if factors[0] in ticks:
+        ax.set_xticks(range(len(ticks[factors[0]])))
+        ax.set_xticklabels(ticks[factors[0]])
+    if ylabel is not None:
+        ax.set_ylabel(ylabel)
+    if len(factors) == 2:
+        handles, labels = ax.get_legend_handles_labels()
+        ax.legend(handles, ticks.get(factors[1], labels), bbox_to_anchor=(0.1, 1))
+        fig.set_size_inches(6, 4)
+    else:
+        fig.set_size_inches(3, 3.5)
+    plt.subplots_adjust(left=0.25, right=0.9, top=0.95, bottom=0.15)
+    fig.savefig(path, dpi=100)
+    plt.close(fig)
+
+# Distance vs. movement time of the selections, coloured by the outlier cutoff (outliers.png)
+def outlier_scatter(data, path, cutoff=0.08):
+    plt.switch_backend('Agg')
+    fig, ax = plt.subplots()
+    ax.scatter(data['b'], data['SelectionDuration'], c=data['b'] < cutoff)
+    ax.set_xlabel('Distance (m)')
+    ax.set_ylabel('Movement Time (ms)')
+    plt.subplots_adjust(left=0.25, right=0.9, top=0.95, bottom=0.15)
+    fig.set_size_inches(3, 3.5)
+    fig.savefig(path, dpi=100)
+    plt.close(fig)
+
+### Skipping unchanged figures
+def _hash_path(path):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), FIGURE_HASHES)
+
+def _store_hashes(directory, hashes):
+    manifest_path = os.path.join(directory, FIGURE_HASHES)
+    manifest = logCache.read_metadata(manifest_path) or {}
+    manifest.update(hashes)
+    logCache.write_metadata(manifest, manifest_path)
+
+def is_current(path, key):
+    manifest = logCache.read_metadata(_hash_path(path)) or {}
+    return os.path.exists(path) and manifest.get(os.path.basename(path)) == key
+
+# outlier_scatter, redrawn only if the selections changed; returns whether it was drawn
+def render_outlier_scatter(data, path, cutoff=0.08):
+    key = data_hash(data[['b', 'SelectionDuration']], ('outliers', cutoff))
+    if is_current(path, key):
+        return False
+    outlier_scatter(data, path, cutoff)
+    _store_hashes(os.path.dirname(os.path.abspath(path)), {os.path.basename(path): key})
+    return True
+
+### Batch
+def _render_job(job):
+    data, dependent_variable, factors, path, ylabel, key = job
+    box_plot(data, dependent_variable, factors, path, ylabel)
+    return os.path.basename(path), key
+
+# Box plots of every dependent variable over every factor and factor pair into directory.
+# ylabels maps a dependent variable to its axis label. Returns the names of the redrawn figures.
+def render_box_plots(data, dependent_variables, directory, ylabels=None, factors=FIGURE_FACTORS, workers=None, force=False):
+    os.makedirs(directory, exist_ok=True)
+    ylabels = ylabels or {}
+    jobs = []
+    for dependent_variable in dependent_variables:
+        for figure_factors in [*([factor] for factor in factors), *(list(pair) for pair in combinations(factors, 2))]:
+            frame = data[[*figure_factors, dependent_variable]].reset_index(drop=True)
+            path = os.path.join(directory, figure_name(dependent_variable, figure_factors))
+            ylabel = ylabels.get(dependent_variable)
+            key = data_hash(frame, (dependent_variable, figure_factors, ylabel))
+            if force or not is_current(path, key):
+                jobs.append((frame, dependent_variable, figure_factors, path, ylabel, key))
+    rendered = dict(map_participants(_render_job, jobs, workers))
+    if rendered:
+        _store_hashes(directory, rendered)
+    return sorted(rendered)
@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+import resultCache
+from conditionIndex import run_starts
+from participantLoader import concat_logs, participant_files, read_log, SELECTIONS, SELECTION_DTYPES
+
+# Fitts' law metrics of data-preprocess.py (https://www.yorku.ca/mack/hhci2018.html, Figure 17.7): per-selection
+# geometry and per-condition effective width, effective ID and throughput
+
+CONDITION_KEYS = ['ParticipantID', 'Movement', 'CircleDirection', 'ReferenceFrame', 'TargetSize']
+
+### Per-selection geometry
+# b: distance from target to selection, a: distance from the previous target to this target,
+# c: distance from the previous target to this selection, dx: selection offset along the task axis,
+# ae: effective amplitude.
+# The previous target is taken within the condition block (a run of CONDITION_KEYS), so it never leaks
+# across participants or conditions; the first selection of a block has no previous target and gets NaN
+# a, c, dx and ae (it is the idle selection with SelectionDuration 0 that is filtered out anyway).
+def add_selection_metrics(data):
+    target_x = data['AbsoluteTargetPositionX'].to_numpy(dtype=np.float64)
+    target_y = data['AbsoluteTargetPositionY'].to_numpy(dtype=np.float64)
+    selection_x = data['AbsoluteSelectionPositionX'].to_numpy(dtype=np.float64)
+    selection_y = data['AbsoluteSelectionPositionY'].to_numpy(dtype=np.float64)
+    previous_x = np.empty(len(data))
+    previous_y = np.empty(len(data))
+    previous_x[1:], previous_y[1:] = target_x[:-1], target_y[:-1]
+    starts = run_starts(data, CONDITION_KEYS)
+    previous_x[starts] = np.nan
+    previous_y[starts] = np.nan
+
+    b = np.hypot(target_x - selection_x, target_y - selection_y)
+    a = np.hypot(target_x - previous_x, target_y - previous_y)
+    c = np.hypot(selection_x - previous_x, selection_y - previous_y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dx = (c * c - b * b - a * a) / (2.0 * a)
+    data['b'] = b
+    data['a'] = a
+    data['c'] = c
+    data['dx'] = dx
+    data['ae'] = a + dx
+    return data
+
+### Per-condition throughput
+# Effective width We = 4.133 * SD(dx), effective index of difficulty IDe = log2(Ae / We + 1) and
+# throughput TP = IDe / MT per condition (https://www.yorku.ca/mack/hhci2018.html, Figure 17.7).
+# One grouped reduction over the selections; duration is the movement time column in ms. MT comes out in s,
+# WeCM and DistanceCM in cm.
+def condition_throughput(selections, keys=CONDITION_KEYS, duration='SelectionDuration'):
+    data = selections.groupby(keys, dropna=False, observed=True, sort=True).agg(
+        Success=('Success', 'mean'), MT=(duration, 'mean'), ae=('ae', 'mean'), SDx=('dx', 'std'), b=('b', 'mean')).reset_index()
+    data['MT'] = data['MT'] / 1000
+    data['WeCM'] = data['SDx'] * 4.133 * 100
+    data['IDe'] = np.log2(data['ae'] * 100 / data['WeCM'] + 1)
+    data['TP'] = data['IDe'] / data['MT']
+    data['DistanceCM'] = data['b'] * 100
+    return data.drop(columns=['b'])
+
+### Outlier threshold sweep
+# Per-condition throughput for many outlier cutoffs on b (a selection is kept if b < cutoff) in one pass:
+# selections are sorted by b within each condition, so every cutoff keeps a prefix of its condition and
+# all sums come from cumulative sums at the prefix end. Cutoffs are absolute (in m) or per condition:
+# median + k * MAD (scaled to the SD of a normal distribution), Q3 + k * IQR, mean + k * SD.
+MAD_SCALE = 1.4826
+
+def _sorted_quantile(values, starts, counts, q):
+    position = (counts - 1) * q
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    fraction = position - lower
+    return values[starts + lower] * (1 - fraction) + values[starts + upper] * fraction
+
+# Number of selections with b < cutoff in the condition of every (group, cutoff) query, by merging the
+# queries into the sorted selections
+def _prefix_lengths(b, group, starts, query_group, query_cutoff):
+    values = np.concatenate([b, query_cutoff])
+    groups = np.concatenate([group, query_group])
+    is_selection = np.concatenate([np.ones(len(b), dtype=np.int8), np.zeros(len(query_cutoff), dtype=np.int8)])
+    # Queries sort before selections with an equal b, so b == cutoff is excluded
+    order = np.lexsort((is_selection, values, groups))
+    selections_before = np.cumsum(is_selection[order]) - is_selection[order]
+    lengths = np.empty(len(query_cutoff), dtype=np.int64)
+    query_positions = order >= len(b)
+    lengths[order[query_positions] - len(b)] = selections_before[query_positions]
+    return lengths - starts[query_group]
+
+def throughput_sweep(selections, cutoffs=(), mad=(), iqr=(), sd=(), keys=CONDITION_KEYS, duration='SelectionDuration'):
+    selections = selections[selections['b'].notna()]
+    conditions = selections.groupby(keys, dropna=False, observed=True, sort=True).ngroup().to_numpy()
+    b = selections['b'].to_numpy(dtype=np.float64)
+    order = np.lexsort((b, conditions))
+    group = conditions[order]
+    b = b[order]
+    condition_count = group.max() + 1 if len(group) else 0
+    counts = np.bincount(group, minlength=condition_count)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    labels = selections.iloc[order[starts]][keys].reset_index(drop=True)
+
+    # Per-condition cutoffs
+    rules = [('absolute', k, np.full(condition_count, k, dtype=np.float64)) for k in cutoffs]
+    if len(mad):
+        median = _sorted_quantile(b, starts, counts, 0.5)
+        deviation = np.abs(b - median[group])
+        deviation = deviation[np.lexsort((deviation, group))]
+        scaled_mad = MAD_SCALE * _sorted_quantile(deviation, starts, counts, 0.5)
+        rules += [('mad', k, median + k * scaled_mad) for k in mad]
+    if len(iqr):
+        q1 = _sorted_quantile(b, starts, counts, 0.25)
+        q3 = _sorted_quantile(b, starts, counts, 0.75)
+        rules += [('iqr', k, q3 + k * (q3 - q1)) for k in iqr]
+    if len(sd):
+        b_sum = np.bincount(group, weights=b, minlength=condition_count)
+        b_mean = b_sum / counts
+        b_sd = np.sqrt(np.bincount(group, weights=(b - b_mean[group]) ** 2, minlength=condition_count) / (counts - 1))
+        rules += [('sd', k, b_mean + k * b_sd) for k in sd]
+    if not rules:
+        return pd.DataFrame()
+
+    query_group = np.tile(np.arange(condition_count), len(rules))
+    query_cutoff = np.concatenate([cutoff for _, _, cutoff in rules])
+    lengths = _prefix_lengths(b, group, starts, query_group, query_cutoff)
+    first = starts[query_group]
+    last = first + lengths
+
+    sorted_selections = selections.iloc[order]
+    result = {}
+    for column, source in [('Success', 'Success'), ('MT', duration), ('ae', 'ae'), ('dx', 'dx'), ('b', 'b')]:
+        values = sorted_selections[source].to_numpy(dtype=np.float64)
+        if column == 'dx':
+            # Centre on the condition mean so the sum of squares does not cancel
+            dx_mean = np.bincount(group, weights=np.nan_to_num(values), minlength=condition_count) / np.maximum(
+                np.bincount(group, weights=~np.isnan(values), minlength=condition_count), 1)
+            values = values - dx_mean[group]
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+        cumulative = np.vstack([np.zeros(3), np.cumsum(np.column_stack([present, filled, filled * filled]), axis=0)])
+        n, total, total_squares = (cumulative[last] - cumulative[first]).T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / n
+            if column == 'dx':
+                result['SDx'] = np.where(n > 1, np.sqrt(np.maximum(total_squares - n * mean * mean, 0) / (n - 1)), np.nan)
+            else:
+                result[column] = mean
+
+    sweep = pd.concat([
+        pd.DataFrame({'method': np.repeat([method for method, _, _ in rules], condition_count),
+                      'parameter': np.repeat([parameter for _, parameter, _ in rules], condition_count),
+                      'cutoff': query_cutoff}),
+        pd.concat([labels] * len(rules), ignore_index=True),
+    ], axis=1)
+    sweep['selections'] = counts[query_group]
+    sweep['kept'] = lengths
+    sweep['Success'] = result['Success']
+    sweep['MT'] = result['MT'] / 1000
+    sweep['ae'] = result['ae']
+    sweep['SDx'] = result['SDx']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sweep['WeCM'] = sweep['SDx'] * 4.133 * 100
+        sweep['IDe'] = np.log2(sweep['ae'] * 100 / sweep['WeCM'] + 1)
+        sweep['TP'] = sweep['IDe'] / sweep['MT']
+    sweep['DistanceCM'] = result['b'] * 100
+    return sweep
+
+# One row per threshold: share of selections kept and the mean of the per-condition metrics
+def sweep_summary(sweep):
+    summary = sweep.groupby(['method', 'parameter'], sort=False).agg(
+        selections=('selections', 'sum'), kept=('kept', 'sum'), Success=('Success', 'mean'), MT=('MT', 'mean'),
+        SDx=('SDx', 'mean'), WeCM=('WeCM', 'mean'), IDe=('IDe', 'mean'), TP=('TP', 'mean')).reset_index()
+    summary.insert(4, 'kept_fraction', summary['kept'] / summary['selections'])
+    return summary
+
+### Per participant
+# Bump when the per-participant computation changes, so cached results are recomputed
+PIPELINE_VERSION = 2
+
+def participant_selections(path):
+    return add_selection_metrics(read_log(path, dtype=SELECTION_DTYPES, cache=True))
+
+# Selections of all participants with their Fitts geometry; unchanged participants come from resultCache
+def study_selections(directory, participant_start, participant_end, recompute=False, verbose=False):
+    frames = []
+    for participant_id, path in participant_files(directory, SELECTIONS, participant_start, participant_end):
+        if verbose:
+            print(f'Processing participant {participant_id}')
+        frames.append(resultCache.load_or_compute('selections', PIPELINE_VERSION, path, participant_selections, recompute=recompute))
+    return concat_logs(frames)
@@ -0,0 +1,309 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+from conditionIndex import build_condition_index, run_starts, segment_ids, segment_max, segment_min, segment_first, segment_sum, timestamp_segments
+from participantLoader import concat_logs, map_participants, participant_files, read_log, HIGH_FREQUENCY, HIGH_FREQUENCY_DTYPES
+
+# Walking metrics of computeStepFrequency.py, computed per condition with offset-based reductions
+# over contiguous arrays instead of groupby.
+
+# Condition starts: every SystemClockTimestampMs restart, also split where the participant changes
+def condition_starts(data):
+    return np.union1d(timestamp_segments(data['SystemClockTimestampMs']), run_starts(data, ['ParticipantID']))
+
+# Horizontal (XZ) distance covered between consecutive samples of the same condition, 0 for the first sample
+def step_distances(x, z, starts):
+    x = np.asarray(x, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    distance = np.zeros(len(x))
+    distance[1:] = np.hypot(x[1:] - x[:-1], z[1:] - z[:-1])
+    distance[starts] = 0
+    return distance
+
+### Distances, durations and speeds per condition
+# Returns the per-condition summary and, with profile_interval_ms, head/path speed in bins of that
+# length within every condition (otherwise None)
+def condition_speeds(data, starts=None, profile_interval_ms=None):
+    starts = condition_starts(data) if starts is None else starts
+    head_distance = step_distances(data['HeadPositionX'], data['HeadPositionZ'], starts)
+    path_distance = step_distances(data['WalkingDirectionPositionX'], data['WalkingDirectionPositionZ'], starts)
+    time = data['RealtimeSinceStartupMs'].to_numpy()
+    condition_ids = segment_ids(timestamp_segments(data['SystemClockTimestampMs']), len(data))
+
+    total_head_distance = segment_sum(head_distance, starts)
+    total_path_distance = segment_sum(path_distance, starts)
+    total_time_sec = (segment_max(time, starts) - segment_min(time, starts)) * 0.001 # times 0.001 to get seconds
+
+    result = pd.DataFrame({
+        'conditionID': condition_ids[starts],
+        'ParticipantID': segment_first(data['ParticipantID'], starts),
+        'movement': data['Movement'].iloc[starts].reset_index(drop=True),
+        'TargetSize': data['TargetSize'].iloc[starts].reset_index(drop=True),
+        'total_head_distance_m': total_head_distance,
+        'total_path_distance_m': total_path_distance,
+        'diff_distance': total_path_distance - total_head_distance,
+        'total_time_sec': total_time_sec,
+    })
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['head_speed_km/h'] = (total_head_distance / total_time_sec) * 3.6 # times 3.6 to get km/h
+        result['path_speed_km/h'] = (total_path_distance / total_time_sec) * 3.6
+    result = result.set_index(['conditionID', 'ParticipantID'])
+
+    if profile_interval_ms is None:
+        return result, None
+
+    # Bins are contiguous inside a condition, so they are reduced with offsets as well
+    segment = segment_ids(starts, len(data))
+    elapsed = time - time[starts][segment]
+    bins = pd.DataFrame({'segment': segment, 'bin': elapsed // profile_interval_ms})
+    bin_starts = run_starts(bins, ['segment', 'bin'])
+    # Time steps are summed like the distances, so every step is counted in exactly one bin
+    time_step = np.zeros(len(time))
+    time_step[1:] = np.diff(time)
+    time_step[starts] = 0
+    bin_time_sec = segment_sum(time_step, bin_starts) * 0.001
+
+    profile = pd.DataFrame({
+        'conditionID': condition_ids[bin_starts],
+        'ParticipantID': segment_first(data['ParticipantID'], bin_starts),
+        'movement': data['Movement'].iloc[bin_starts].reset_index(drop=True),
+        'time_sec': bins['bin'].to_numpy()[bin_starts] * profile_interval_ms * 0.001,
+    })
+    with np.errstate(divide='ignore', invalid='ignore'):
+        profile['head_speed_km/h'] = segment_sum(head_distance, bin_starts) / bin_time_sec * 3.6
+        profile['path_speed_km/h'] = segment_sum(path_distance, bin_starts) / bin_time_sec * 3.6
+    return result, profile
+
+### Step frequency
+# Steps are the minima of the smoothed head height: a sample is a step if it is the minimum of the
+# MINIMUM_WINDOW samples centred on it (same window as the former rolling(10, center=True).min()).
+# Everything runs within one condition at a time, so windows never span condition or participant
+# boundaries. Smoothing follows ApplyOfflineWeightedAverage(windowSize: 5, LinearKernel, timestamps)
+# of the C# CalcStepFrequency reference at the top of computeStepFrequency.py.
+
+MINIMUM_WINDOW = 10
+SMOOTHING_WINDOW = 5
+
+def linear_kernel(distance):
+    return np.maximum(0, 1 - np.abs(distance))
+
+# Weight of a neighbour is linear_kernel(time distance / bandwidth), with the bandwidth set to
+# (half window + 1) mean sample intervals of the neighbourhood, so irregular frame timing is respected
+def _kernel_weights(time_offsets, span, count, half):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bandwidth = (half + 1) * span / np.maximum(count - 1, 1)
+        return np.where(bandwidth > 0, linear_kernel(time_offsets / bandwidth), 1.0)
+
+def smooth_head_height(values, timestamps, starts, window=SMOOTHING_WINDOW, kernel=linear_kernel):
+    values = np.asarray(values, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    n = len(values)
+    half = window // 2
+    segment = segment_ids(starts, n)
+    position = np.arange(n)
+
+    neighbours = []
+    for offset in range(-half, half + 1):
+        neighbour = np.clip(position + offset, 0, n - 1)
+        valid = segment[neighbour] == segment
+        neighbours.append((neighbour, valid & (position + offset >= 0) & (position + offset < n)))
+
+    valid_matrix = np.array([valid for _, valid in neighbours])
+    time_matrix = np.array([timestamps[neighbour] for neighbour, _ in neighbours])
+    first = np.where(valid_matrix, time_matrix, np.inf).min(axis=0)
+    last = np.where(valid_matrix, time_matrix, -np.inf).max(axis=0)
+    count = valid_matrix.sum(axis=0)
+
+    weighted = np.zeros(n)
+    total = np.zeros(n)
+    for neighbour, valid in neighbours:
+        weights = np.where(valid, _kernel_weights(timestamps[neighbour] - timestamps, last - first, count, half), 0)
+        weighted += weights * values[neighbour]
+        total += weights
+    return weighted / total
+
+# Trailing sliding minimum, out[j] = min(values[j - window + 1 .. j]); linear time (van Herk / Gil-Werman)
+def sliding_min(values, window):
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    padded_length = -(-n // window) * window
+    padded = np.full(padded_length, np.inf)
+    padded[:n] = values
+    blocks = padded.reshape(-1, window)
+    prefix = np.minimum.accumulate(blocks, axis=1).ravel()
+    suffix = np.minimum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    out = np.full(n, np.nan)
+    j = np.arange(window - 1, n)
+    out[window - 1:] = np.minimum(suffix[j - window + 1], prefix[j])
+    return out
+
+# Mask of samples that are the minimum of the full centred window inside their own condition
+def step_mask(values, starts, window=MINIMUM_WINDOW):
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    before, after = window // 2, window - 1 - window // 2
+    segment = segment_ids(starts, n)
+    position = np.arange(n)
+    ends = np.append(starts[1:], n)
+    full_window = (position - starts[segment] >= before) & (ends[segment] - 1 - position >= after)
+    window_min = np.full(n, np.nan)
+    window_min[:n - after] = sliding_min(values, window)[after:]
+    return full_window & (values == window_min)
+
+def step_frequency(interval_sum_ms, intervals):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(intervals > 0, 60 / (interval_sum_ms / np.maximum(intervals, 1) * 0.001), np.nan)
+
+CONDITION_COLUMNS = ['ParticipantID', 'Movement', 'ReferenceFrame', 'TargetSize']
+
+# One row per condition with the number of steps, the summed time between consecutive steps and steps/min
+def condition_step_frequencies(data, starts=None, window=MINIMUM_WINDOW, smoothing_window=SMOOTHING_WINDOW):
+    starts = condition_starts(data) if starts is None else starts
+    timestamps = data['SystemClockTimestampMs'].to_numpy()
+    smoothed = smooth_head_height(data['HeadPositionY'], timestamps, starts, smoothing_window)
+    steps = np.flatnonzero(step_mask(smoothed, starts, window))
+
+    step_segment = segment_ids(starts, len(data))[steps]
+    same_condition = step_segment[1:] == step_segment[:-1]
+    interval_segment = step_segment[1:][same_condition]
+    interval = (timestamps[steps[1:]] - timestamps[steps[:-1]])[same_condition]
+
+    result = pd.DataFrame({column: data[column].iloc[starts].reset_index(drop=True) for column in CONDITION_COLUMNS})
+    result['steps'] = np.bincount(step_segment, minlength=len(starts))
+    result['intervals'] = np.bincount(interval_segment, minlength=len(starts))
+    result['interval_sum_ms'] = np.bincount(interval_segment, weights=interval, minlength=len(starts))
+    result['step_frequency'] = step_frequency(result['interval_sum_ms'].to_numpy(), result['intervals'].to_numpy())
+    return result
+
+# Steps/min per participant x movement x reference frame x target size
+def step_frequency_table(conditions):
+    table = conditions.groupby(CONDITION_COLUMNS, observed=True)[['steps', 'intervals', 'interval_sum_ms']].sum().reset_index()
+    table['step_frequency'] = step_frequency(table['interval_sum_ms'].to_numpy(), table['intervals'].to_numpy())
+    return table
+
+### Incremental step detection
+# Same detector for samples arriving one at a time (e.g. a log still being written). Smoothing and the
+# monotonic-deque window minimum each lag a few samples; finish() flushes them at the end of a condition.
+class StreamingStepDetector:
+    def __init__(self, window=MINIMUM_WINDOW, smoothing_window=SMOOTHING_WINDOW):
+        self.window = window
+        self.half = smoothing_window // 2
+        self.reset()
+
+    def reset(self):
+        self._raw = deque()
+        self._raw_index = 0
+        self._smoothed_index = 0
+        self._recent = deque(maxlen=self.window)
+        self._minima = deque()
+        self.step_timestamps = []
+
+    # Returns the timestamps of steps confirmed by this sample
+    def push(self, timestamp, value):
+        self._raw.append((timestamp, value))
+        self._raw_index += 1
+        steps = []
+        if self._raw_index - self._smoothed_index > self.half:
+            steps += self._emit_smoothed()
+        return steps
+
+    def finish(self):
+        steps = []
+        while self._smoothed_index < self._raw_index:
+            steps += self._emit_smoothed()
+        self.reset()
+        return steps
+
+    def _emit_smoothed(self):
+        index = self._smoothed_index
+        first_raw = self._raw_index - len(self._raw)
+        neighbours = [self._raw[i - first_raw] for i in range(max(index - self.half, first_raw), min(index + self.half + 1, self._raw_index))]
+        timestamp = self._raw[index - first_raw][0]
+        times = np.array([t for t, _ in neighbours], dtype=np.float64)
+        weights = _kernel_weights(times - timestamp, times.max() - times.min(), len(neighbours), self.half)
+        smoothed = float(np.dot(weights, [v for _, v in neighbours]) / weights.sum())
+        self._smoothed_index += 1
+        while len(self._raw) and self._raw_index - len(self._raw) < self._smoothed_index - self.half:
+            self._raw.popleft()
+        return self._push_smoothed(index, timestamp, smoothed)
+
+    def _push_smoothed(self, index, timestamp, value):
+        self._recent.append((index, timestamp, value))
+        while self._minima and self._minima[-1][1] >= value:
+            self._minima.pop()
+        self._minima.append((index, value))
+        if self._minima[0][0] <= index - self.window:
+            self._minima.popleft()
+        if index < self.window - 1:
+            return []
+        centre_index, centre_timestamp, centre_value = self._recent[self.window // 2]
+        if centre_value == self._minima[0][1]:
+            self.step_timestamps.append(centre_timestamp)
+            return [centre_timestamp]
+        return []
+
+### Target distances
+# Mean distance of the targets from the head along the walking direction (ZDistance) and height of the
+# targets (FloorDistance) per participant and reference frame
+def target_distances(data):
+    distance = data[['AllTargetsPositionX', 'AllTargetsPositionY', 'AllTargetsPositionZ']].values - data[['HeadPositionX', 'HeadPositionY', 'HeadPositionZ']].values
+    distances = data[['ParticipantID', 'ReferenceFrame', 'AllTargetsPositionY']].copy()
+    distances['DotProduct'] = (data[['WalkingDirectionForwardX', 'WalkingDirectionForwardY', 'WalkingDirectionForwardZ']].values * distance).sum(axis=1)
+    grouped = distances.groupby(['ParticipantID', 'ReferenceFrame'], observed=True).agg({'DotProduct': 'mean', 'AllTargetsPositionY': 'mean'})
+    return grouped.rename(columns={'DotProduct': 'ZDistance', 'AllTargetsPositionY': 'FloorDistance'})
+
+### Per participant / study
+# Nothing above crosses a participant boundary, so computeStepFrequency.py runs the whole pipeline per
+# participant in worker processes and only reduces the small per-condition frames.
+GAIT_COLUMNS = [
+    'ParticipantID', 'Movement', 'CircleDirection', 'ReferenceFrame', 'TargetSize', 'ActiveTargetIndex', 'RealtimeSinceStartupMs', 'SystemClockTimestampMs',
+    'HeadPositionX', 'HeadPositionY', 'HeadPositionZ', 'WalkingDirectionPositionX', 'WalkingDirectionPositionZ',
+    'WalkingDirectionForwardX', 'WalkingDirectionForwardY', 'WalkingDirectionForwardZ',
+    'AllTargetsPositionX', 'AllTargetsPositionY', 'AllTargetsPositionZ',
+]
+
+def participant_gait(path, profile_interval_ms=None):
+    data = read_log(path, GAIT_COLUMNS, HIGH_FREQUENCY_DTYPES, cache=True)
+    starts = condition_starts(data)
+    speeds, speed_profile = condition_speeds(data, starts, profile_interval_ms)
+    timestamps = data['SystemClockTimestampMs'].to_numpy()
+    return {
+        'runs': build_condition_index(data),
+        'steps': condition_step_frequencies(data, starts),
+        'speeds': speeds.reset_index(),
+        'speed_profile': speed_profile,
+        'target_distances': target_distances(data).reset_index(),
+        # conditionID numbering continues over participants like in one concatenated log
+        'conditions': len(timestamp_segments(timestamps)),
+        'timestamps': (timestamps[0], timestamps[-1]) if len(timestamps) else None,
+    }
+
+def _participant_gait_args(args):
+    return participant_gait(*args)
+
+def _condition_offsets(results):
+    offsets = []
+    offset = 0
+    previous = None
+    for result in results:
+        if previous is not None and previous['timestamps'] is not None and result['timestamps'] is not None:
+            # The first condition continues the previous participant's last one unless the timestamp restarts
+            offset += previous['conditions'] - int(result['timestamps'][0] > previous['timestamps'][1])
+        offsets.append(offset)
+        previous = result
+    return offsets
+
+# Returns the concatenated per-participant frames in participant order: runs, steps, speeds (indexed by
+# conditionID and ParticipantID), speed_profile (None without profile_interval_ms) and target_distances
+def study_gait(directory, participant_start, participant_end, profile_interval_ms=None, workers=None):
+    paths = participant_files(directory, HIGH_FREQUENCY, participant_start, participant_end)
+    results = map_participants(_participant_gait_args, [(path, profile_interval_ms) for _, path in paths], workers)
+    for result, offset in zip(results, _condition_offsets(results)):
+        result['speeds']['conditionID'] += offset
+        if result['speed_profile'] is not None:
+            result['speed_profile']['conditionID'] += offset
+    study = {key: concat_logs([result[key] for result in results]) for key in ['runs', 'steps', 'speeds', 'target_distances']}
+    study['speeds'] = study['speeds'].set_index(['conditionID', 'ParticipantID'])
+    study['target_distances'] = study['target_distances'].set_index(['ParticipantID', 'ReferenceFrame'])
+    study['speed_profile'] = concat_logs([result['speed_profile'] for result in results]) if profile_interval_ms is not None else None
+    return study
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from conditionIndex import segment_first, segment_lengths
+from gaitMetrics import condition_starts, CONDITION_COLUMNS
+from participantLoader import concat_logs, map_participants, participant_files, read_log, HIGH_FREQUENCY, HIGH_FREQUENCY_DTYPES
+
+# Welch power spectra per condition, batched over all conditions of a participant: every condition is
+# resampled to a uniform grid, cut into overlapping windows, and all windows of all conditions go through
+# one detrend / taper / rfft. Head height gives the gait frequency (one vertical bob per step), target and
+# palm positions give how much the target panel and the hand oscillate in each frequency band.
+
+SAMPLE_RATE = 90
+# 256 samples at 90 Hz: 2.8 s windows, 0.35 Hz resolution; conditions shorter than one window get NaN
+WINDOW_SAMPLES = 256
+WINDOW_STEP = WINDOW_SAMPLES // 2
+# Dominant gait frequency is searched in 1-3 Hz (60-180 steps/min)
+GAIT_BAND = (1.0, 3.0)
+HARMONICS = 3
+# Power of a harmonic is integrated over +-HARMONIC_WIDTH Hz around it
+HARMONIC_WIDTH = 0.25
+# Target / palm oscillation power is reported per band (name: (low Hz, high Hz))
+BANDS = {'Sway': (0.1, 1.0), 'Gait': (1.0, 3.0), 'Shake': (3.0, 12.0)}
+
+TARGET_COLUMNS = ['AllTargetsPositionX', 'AllTargetsPositionY', 'AllTargetsPositionZ']
+PALM_COLUMNS = ['DominantPalmCenterPositionX', 'DominantPalmCenterPositionY', 'DominantPalmCenterPositionZ']
+SPECTRUM_COLUMNS = ['HeadPositionY', *TARGET_COLUMNS, *PALM_COLUMNS]
+
+def frequencies(window=WINDOW_SAMPLES, sample_rate=SAMPLE_RATE):
+    return np.fft.rfftfreq(window, 1 / sample_rate)
+
+### Uniform resampling
+# Linear interpolation of every segment onto its own grid t0, t0 + 1/rate, ...; segments are shifted apart
+# on one time axis so a single np.interp call covers all of them. Returns the resampled (n, channels)
+# values and the start of every segment in them.
+def resample_segments(values, timestamps, starts, sample_rate=SAMPLE_RATE):
+    seconds = np.asarray(timestamps, dtype=np.float64) * 0.001
+    lengths = segment_lengths(starts, len(seconds))
+    first = np.repeat(seconds[starts], lengths)
+    local = seconds - first
+    spans = np.maximum.reduceat(local, starts) if len(starts) else np.zeros(0)
+    grid_lengths = np.floor(spans * sample_rate + 1e-9).astype(np.int64) + 1
+    grid_starts = np.concatenate(([0], np.cumsum(grid_lengths)[:-1])).astype(np.int64)
+    # Offsets larger than any span keep the shifted segments strictly increasing
+    gap = (spans.max() if len(spans) else 0) + 1
+    shifted = local + np.repeat(np.arange(len(starts)) * gap, lengths)
+    grid_segment = np.repeat(np.arange(len(starts)), grid_lengths)
+    grid = (np.arange(grid_lengths.sum()) - grid_starts[grid_segment]) / sample_rate + grid_segment * gap
+    values = np.asarray(values, dtype=np.float64).reshape(len(seconds), -1)
+    resampled = np.column_stack([np.interp(grid, shifted, values[:, channel]) for channel in range(values.shape[1])])
+    return resampled, grid_starts
+
+### Welch
+# Start of every window (into the resampled values) and the segment it belongs to
+def welch_windows(grid_starts, grid_length, window=WINDOW_SAMPLES, step=WINDOW_STEP):
+    lengths = segment_lengths(grid_starts, grid_length)
+    counts = np.where(lengths >= window, (lengths - window) // step + 1, 0)
+    window_segment = np.repeat(np.arange(len(grid_starts)), counts)
+    first_window = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    window_starts = grid_starts[window_segment] + (np.arange(counts.sum()) - first_window[window_segment]) * step
+    return window_starts, window_segment, counts
+
+# One-sided PSD density (units^2/Hz) per segment and channel, as scipy.signal.welch with a Hann window,
+# 50% overlap, linear detrend and mean averaging; shape (segments, channels, frequencies), and the number
+# of windows averaged per segment
+def welch_segments(resampled, grid_starts, window=WINDOW_SAMPLES, step=WINDOW_STEP, sample_rate=SAMPLE_RATE):
+    window_starts, window_segment, counts = welch_windows(grid_starts, len(resampled), window, step)
+    # (windows, samples, channels)
+    frames = resampled[window_starts[:, None] + np.arange(window)]
+    # Least-squares line per window and channel
+    x = np.arange(window) - (window - 1) / 2
+    slope = np.einsum('s,wsc->wc', x, frames) / np.dot(x, x)
+    frames = frames - frames.mean(axis=1, keepdims=True) - slope[:, None, :] * x[:, None]
+    taper = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(window) / window)
+    power = np.abs(np.fft.rfft(frames * taper[:, None], axis=1)) ** 2 / (sample_rate * np.dot(taper, taper))
+    power[:, 1:(None if window % 2 else -1)] *= 2
+    spectra = np.full((len(grid_starts), resampled.shape[1], window // 2 + 1), np.nan)
+    has_windows = counts > 0
+    if has_windows.any():
+        first_window = np.concatenate(([0], np.cumsum(counts)[:-1]))[has_windows]
+        sums = np.add.reduceat(power, first_window, axis=0)
+        spectra[has_windows] = sums.transpose(0, 2, 1) / counts[has_windows, None, None]
+    return spectra, counts
+
+### Spectral measures
+# Power integrated over [low, high) Hz along the last axis
+def band_power(spectra, frequency, low, high):
+    in_band = (frequency >= low) & (frequency < high)
+    return spectra[..., in_band].sum(axis=-1) * (frequency[1] - frequency[0])
+
+# Peak frequency within band, refined between bins by a parabola through the log power of the peak and its
+# neighbours (Gaussian interpolation, nearly unbiased for the Hann window)
+def dominant_frequency(spectra, frequency, band=GAIT_BAND):
+    in_band = np.flatnonzero((frequency >= band[0]) & (frequency <= band[1]))
+    rows = np.arange(len(spectra))
+    peak = in_band[np.argmax(np.nan_to_num(spectra[:, in_band], nan=-np.inf), axis=1)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        left, centre, right = (np.log(spectra[rows, np.clip(peak + offset, 0, len(frequency) - 1)]) for offset in (-1, 0, 1))
+        curvature = left - 2 * centre + right
+        shift = np.where(curvature < 0, 0.5 * (left - right) / curvature, 0)
+    result = frequency[peak] + np.clip(shift, -0.5, 0.5) * (frequency[1] - frequency[0])
+    return np.where(np.isnan(centre), np.nan, result)
+
+# Power around h * fundamental for every segment
+def harmonic_power(spectra, frequency, fundamental, harmonic, width=HARMONIC_WIDTH):
+    centre = fundamental[:, None] * harmonic
+    in_band = np.abs(frequency[None, :] - centre) <= width
+    return (spectra * in_band).sum(axis=-1) * (frequency[1] - frequency[0])
+
+### Per condition
+# One row per condition: gait frequency (Hz and steps/min) from the head height spectrum with the power of
+# its harmonics, and the summed X/Y/Z power of target and palm position per band
+def condition_spectra(data, starts=None, bands=BANDS, window=WINDOW_SAMPLES, sample_rate=SAMPLE_RATE):
+    starts = condition_starts(data) if starts is None else starts
+    resampled, grid_starts = resample_segments(data[SPECTRUM_COLUMNS].to_numpy(), data['SystemClockTimestampMs'].to_numpy(), starts, sample_rate)
+    spectra, counts = welch_segments(resampled, grid_starts, window, window // 2, sample_rate)
+    frequency = frequencies(window, sample_rate)
+
+    result = pd.DataFrame({column: segment_first(data[column], starts) for column in CONDITION_COLUMNS})
+    result['Windows'] = counts
+    head = spectra[:, 0]
+    gait_frequency = dominant_frequency(head, frequency)
+    result['GaitFrequency'] = gait_frequency
+    result['SpectralStepFrequency'] = gait_frequency * 60
+    for harmonic in range(1, HARMONICS + 1):
+        result['GaitHarmonic' + str(harmonic) + 'Power'] = harmonic_power(head, frequency, gait_frequency, harmonic)
+    for name, (low, high) in bands.items():
+        power = band_power(spectra, frequency, low, high)
+        result['Target' + name + 'Power'] = power[:, 1:4].sum(axis=1)
+        result['Palm' + name + 'Power'] = power[:, 4:7].sum(axis=1)
+    return result
+
+# Mean per reference frame x movement
+def spectra_summary(conditions, bands=BANDS):
+    columns = ['SpectralStepFrequency', *('Target' + name + 'Power' for name in bands)]
+    return conditions.groupby(['ReferenceFrame', 'Movement'], observed=True)[columns].mean()
+
+### Per participant / study
+SPECTRA_COLUMNS = ['ParticipantID', 'Movement', 'ReferenceFrame', 'TargetSize', 'SystemClockTimestampMs', *SPECTRUM_COLUMNS]
+
+def participant_spectra(args):
+    path, bands = args
+    return condition_spectra(read_log(path, SPECTRA_COLUMNS, HIGH_FREQUENCY_DTYPES, cache=True), bands=bands)
+
+def study_spectra(directory, participant_start, participant_end, bands=BANDS, workers=None):
+    paths = participant_files(directory, HIGH_FREQUENCY, participant_start, participant_end)
+    return concat_logs(map_participants(participant_spectra, [(path, bands) for _, path in paths], workers))
@@ -0,0 +1,277 @@
+import io
+import os
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import pandas as pd
+import logCache
+from participantLoader import concat_logs, numeric_categories, DEFAULT_DTYPES, SELECTIONS, HIGH_FREQUENCY
+from syntheticLogs import SELECTION_LOG_COLUMNS, HIGH_FREQUENCY_LOG_COLUMNS
+
+# Local stand-in for the CSV logging on the headset: headsets (or replayClient.py) stream the rows of
+# their logs to this asyncio server, which writes them to {id}_selections.csv / {id}_highFrequency.csv
+# in the output directory and, when a log is complete, straight into logCache from the parsed batches,
+# so the analysis scripts start without parsing the CSVs again.
+#
+# Protocol (plain text, rows exactly as the CSV loggers write them):
+#   TCP  one connection per log: 'HELLO <participant id> <selections|highFrequency>\n', the CSV header,
+#        then rows. A HELLO for a log that is still open is answered with ERROR. Reading pauses while a
+#        batch is written, so a fast sender is slowed down by TCP flow control (backpressure) instead of
+#        losing rows.
+#   UDP  datagrams 'ROWS <participant id> <kind> <index of the first row>\n' followed by rows in the column
+#        order of ExperimentManager.cs, then 'END <participant id> <kind> <row count>\n' (sent a few times).
+#        Gaps in the row indices, including rows missing before END, are counted as lost rows, late
+#        datagrams and rows arriving while the buffer is full are dropped and counted. A log announced by
+#        END whose rows were all lost is still reported, without creating its file.
+
+LOG_COLUMNS = {SELECTIONS: SELECTION_LOG_COLUMNS, HIGH_FREQUENCY: HIGH_FREQUENCY_LOG_COLUMNS}
+LOG_KINDS = {kind.encode(): kind for kind in LOG_COLUMNS}
+DEFAULT_PORT = 9100
+# Rows parsed and appended per batch; buffered rows are written at least every FLUSH_SECONDS
+BATCH_ROWS = 2000
+FLUSH_SECONDS = 1.0
+# UDP rows arriving with more than this many rows buffered are dropped
+MAX_BUFFERED_ROWS = 50000
+READ_BYTES = 1 << 16
+UDP_RECEIVE_BUFFER = 1 << 24
+
+# Participant IDs and row indices / counts are plain non-negative integers; anything else is None
+def _count(field):
+    return int(field) if field.isdigit() else None
+
+def empty_stats(expected=None):
+    return {'expected': expected, 'received': 0, 'written': 0, 'batches': 0, 'dropped': 0, 'lost': expected or 0, 'late': 0,
+            'max_buffered': 0, 'backpressure_seconds': 0.0, 'write_seconds': 0.0}
+
+### One log of one participant
+class LogSink:
+    def __init__(self, directory, participant_id, kind, header, cache=True):
+        self.participant_id = participant_id
+        self.kind = kind
+        self.header = header
+        self.dtype = DEFAULT_DTYPES[kind]
+        self.path = os.path.join(directory, f'{participant_id}_{kind}.csv')
+        resumed = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        self.file = open(self.path, 'ab')
+        if not resumed:
+            self.file.write(header)
+        # A resumed log holds rows that were never buffered here; its cache is built on the first read instead
+        self.batches = [] if cache and not resumed and logCache.cache_available() else None
+        self.rows = []
+        self.next_index = 0
+        self.stats = empty_stats()
+        self._lock = asyncio.Lock()
+        self.closed = False
+
+    def add(self, rows):
+        self.rows.extend(rows)
+        self.stats['received'] += len(rows)
+        self.stats['max_buffered'] = max(self.stats['max_buffered'], len(self.rows))
+
+    # Rows of a UDP datagram starting at row index first
+    def add_datagram(self, first, rows):
+        if first < self.next_index:
+            self.stats['late'] += len(rows)
+            return
+        self.stats['lost'] += first - self.next_index
+        self.next_index = first + len(rows)
+        if len(self.rows) + len(rows) > MAX_BUFFERED_ROWS:
+            self.stats['dropped'] += len(rows)
+            return
+        self.add(rows)
+
+    # END of a UDP log with row_count rows: rows after the last datagram that arrived are lost
+    def end_datagrams(self, row_count):
+        self.stats['expected'] = row_count
+        if row_count > self.next_index:
+            self.stats['lost'] += row_count - self.next_index
+            self.next_index = row_count
+
+    def _write(self, rows):
+        start = time.perf_counter()
+        data = b''.join(rows)
+        self.file.write(data)
+        self.file.flush()
+        if self.batches is not None:
+            self.batches.append(numeric_categories(pd.read_csv(io.BytesIO(self.header + data), dtype=self.dtype)))
+        self.stats['written'] += len(rows)
+        self.stats['batches'] += 1
+        self.stats['write_seconds'] += time.perf_counter() - start
+
+    async def flush(self):
+        async with self._lock:
+            if not self.rows:
+                return
+            rows, self.rows = self.rows, []
+            # Parsing and file I/O run in a thread, the event loop keeps accepting rows
+            await asyncio.get_running_loop().run_in_executor(None, self._write, rows)
+
+    async def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        await self.flush()
+        self.file.close()
+        if self.batches:
+            data = concat_logs(self.batches)
+            self.batches = None
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: logCache.build(self.path, logCache.default_cache_directory(self.path), lambda path: data, self.dtype))
+
+### Server
+class IngestServer:
+    def __init__(self, directory, cache=True):
+        self.directory = directory
+        self.cache = cache
+        self.sinks = {}
+        self.malformed_datagrams = 0
+        # Row counts of UDP logs announced by END without any rows received; these get no file, so the
+        # batch loaders do not pick up an empty participant
+        self.unreceived = {}
+        self.started = time.perf_counter()
+        os.makedirs(directory, exist_ok=True)
+
+    def sink(self, participant_id, kind, header):
+        sink = self.sinks.get((participant_id, kind))
+        if sink is None or sink.closed:
+            sink = self.sinks[(participant_id, kind)] = LogSink(self.directory, participant_id, kind, header, self.cache)
+        return sink
+
+    async def handle_tcp(self, reader, writer):
+        sink = None
+        try:
+            hello = (await reader.readline()).split()
+            if len(hello) != 3 or hello[0] != b'HELLO' or _count(hello[1]) is None or hello[2] not in LOG_KINDS:
+                writer.write(b'ERROR expected HELLO <participant id> <selections|highFrequency>\n')
+                return
+            participant_id, kind = _count(hello[1]), LOG_KINDS[hello[2]]
+            header = await reader.readline()
+            # One writer per log: a second connection would interleave rows and close the file under the first.
+            # No await between the check and creating the sink, so concurrent HELLOs cannot both pass.
+            if (participant_id, kind) in self.sinks and not self.sinks[(participant_id, kind)].closed:
+                writer.write(f'ERROR {participant_id}_{kind} is already being received\n'.encode())
+                return
+            sink = self.sink(participant_id, kind, header)
+            remainder = b''
+            while data := await reader.read(READ_BYTES):
+                data = remainder + data
+                end = data.rfind(b'\n') + 1
+                remainder = data[end:]
+                if end:
+                    sink.add(data[:end].splitlines(keepends=True))
+                if len(sink.rows) >= BATCH_ROWS:
+                    # Not reading while the batch is written fills the TCP window and slows the sender down
+                    start = time.perf_counter()
+                    await sink.flush()
+                    sink.stats['backpressure_seconds'] += time.perf_counter() - start
+            if remainder:
+                sink.add([remainder + b'\n'])
+        finally:
+            if sink is not None:
+                await sink.close()
+            writer.close()
+
+    def handle_datagram(self, datagram):
+        header_end = datagram.find(b'\n') + 1
+        fields = datagram[:header_end].split()
+        if (len(fields) != 4 or fields[0] not in (b'ROWS', b'END') or fields[2] not in LOG_KINDS
+                or _count(fields[1]) is None or _count(fields[3]) is None):
+            # Ignored, there is no sender to answer
+            self.malformed_datagrams += 1
+            return
+        participant_id, kind = _count(fields[1]), LOG_KINDS[fields[2]]
+        existing = self.sinks.get((participant_id, kind))
+        if fields[0] == b'END':
+            if existing is None or existing.closed:
+                self.unreceived[(participant_id, kind)] = _count(fields[3])
+            else:
+                existing.end_datagrams(_count(fields[3]))
+            return
+        sink = self.sink(participant_id, kind, (','.join(LOG_COLUMNS[kind]) + '\n').encode())
+        sink.add_datagram(_count(fields[3]), datagram[header_end:].splitlines(keepends=True))
+        # Rows arriving after their END (reordered datagrams)
+        if (participant_id, kind) in self.unreceived:
+            sink.end_datagrams(self.unreceived.pop((participant_id, kind)))
+        if len(sink.rows) >= BATCH_ROWS and not sink._lock.locked():
+            asyncio.ensure_future(sink.flush())
+
+    async def flush_all(self):
+        await asyncio.gather(*(sink.flush() for sink in self.sinks.values() if not sink.closed))
+
+    async def close(self):
+        await asyncio.gather(*(sink.close() for sink in self.sinks.values()))
+
+    def statistics(self):
+        seconds = time.perf_counter() - self.started
+        stats = {key: sink.stats for key, sink in self.sinks.items()}
+        stats.update({key: empty_stats(row_count) for key, row_count in self.unreceived.items() if key not in stats})
+        return {'seconds': seconds, 'malformed_datagrams': self.malformed_datagrams,
+                'logs': [{'participant': participant_id, 'kind': kind, **log, 'rows_per_second': log['written'] / seconds}
+                         for (participant_id, kind), log in sorted(stats.items())]}
+
+def print_statistics(statistics):
+    print(f"{statistics['seconds']:.1f} s, {statistics['malformed_datagrams']} malformed datagrams")
+    for log in statistics['logs']:
+        expected = '' if log['expected'] is None else f" of {log['expected']}"
+        print(f"  {log['participant']:4d} {log['kind']:<14} {log['written']:9d} written{expected} {log['rows_per_second']:9.0f} rows/s  "
+              f"{log['dropped']} dropped {log['lost']} lost {log['late']} late  max buffered {log['max_buffered']}  "
+              f"backpressure {log['backpressure_seconds']:.2f} s")
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, address):
+        self.server.handle_datagram(data)
+
+async def serve(directory, host, port, cache=True, statistics_interval=None, statistics_path=None):
+    server = IngestServer(directory, cache)
+    tcp = await asyncio.start_server(server.handle_tcp, host, port)
+    udp, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: _DatagramProtocol(server), local_addr=(host, port))
+    # Datagrams arriving while a batch is parsed wait in the socket buffer (capped by the OS, e.g. net.core.rmem_max)
+    udp.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER)
+    print(f'Listening on {host}:{port} (TCP and UDP), writing to {directory}')
+    # SIGINT / SIGTERM end the server after closing every log (where the event loop supports signals)
+    stop = asyncio.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal_number, stop.set)
+        except NotImplementedError:
+            pass
+    last_statistics = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            await server.flush_all()
+            if statistics_interval and time.perf_counter() - last_statistics >= statistics_interval:
+                print_statistics(server.statistics())
+                last_statistics = time.perf_counter()
+    finally:
+        tcp.close()
+        udp.close()
+        await server.close()
+        statistics = server.statistics()
+        print_statistics(statistics)
+        if statistics_path:
+            with open(statistics_path, 'w') as file:
+                json.dump(statistics, file, indent=2)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory', help='where the {id}_*.csv logs (and their .analysis_cache) are written')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--no-cache', action='store_true', help='only write the CSV logs')
+    parser.add_argument('--statistics-interval', type=float, metavar='SECONDS', help='print the ingest statistics every SECONDS')
+    parser.add_argument('--statistics', metavar='FILE', help='write the final ingest statistics as JSON')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.directory, args.host, args.port, not args.no_cache, args.statistics_interval, args.statistics))
+    except KeyboardInterrupt:
+        pass
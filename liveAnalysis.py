@@ -0,0 +1,317 @@
+import io
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from completenessCheck import EXPECTED_LEVELS, SELECTIONS_PER_CELL
+from fittsMetrics import add_selection_metrics
+from gaitMetrics import step_distances, step_frequency, StreamingStepDetector
+from participantLoader import SELECTIONS, HIGH_FREQUENCY
+from targetGeometry import target_geometry
+
+# Live view of a session in progress: tails {id}_highFrequency.csv and {id}_selections.csv while the
+# headset loggers are still appending, e.g. python liveAnalysis.py <directory> 12
+# Every refresh parses only the complete rows appended since the last one and folds them into running
+# per-condition aggregates (head / path speed, step frequency, Decline / Depth, Fitts throughput), so
+# nothing is parsed twice and memory does not grow with the session length: one aggregate per condition,
+# the step detector of the running condition and the last row of each log.
+
+CONDITION_KEY = ['Movement', 'CircleDirection', 'ReferenceFrame', 'TargetSize']
+HIGH_FREQUENCY_COLUMNS = [
+    *CONDITION_KEY, 'RealtimeSinceStartupMs', 'SystemClockTimestampMs',
+    'HeadPositionX', 'HeadPositionY', 'HeadPositionZ', 'TrackPositionY', 'WalkingDirectionPositionX', 'WalkingDirectionPositionZ',
+    'WalkingDirectionForwardX', 'WalkingDirectionForwardZ', 'AllTargetsPositionX', 'AllTargetsPositionY', 'AllTargetsPositionZ',
+]
+SELECTION_COLUMNS = [
+    'ParticipantID', *CONDITION_KEY, 'SystemClockTimestampMs', 'AbsoluteTargetPositionX', 'AbsoluteTargetPositionY',
+    'AbsoluteSelectionPositionX', 'AbsoluteSelectionPositionY', 'Success', 'SelectionDuration',
+]
+# At most this much of a log is parsed per read, so one refresh stays within its latency budget
+CHUNK_BYTES = 1 << 22
+# Same outlier cutoff on b (m) as data-preprocess.py
+OUTLIER_CUTOFF = 0.08
+
+# Plausibility checks of finished conditions
+STEP_FREQUENCY_RANGE = (70, 150) # steps/min while walking
+MINIMUM_PATH_SPEED = 1.0 # km/h of the walking track in Walking / Circle
+MINIMUM_CHECK_SECONDS = 5
+
+### Tailing
+# Complete rows appended to a CSV log since the previous read. The offset only advances past the last
+# newline, so a row the logger is still writing is picked up whole by the next read.
+class LogTail:
+    def __init__(self, path, usecols, chunk_bytes=CHUNK_BYTES):
+        self.path = path
+        self.usecols = usecols
+        self.chunk_bytes = chunk_bytes
+        self.offset = 0
+        self.header = None
+
+    def pending(self):
+        try:
+            return max(0, os.path.getsize(self.path) - self.offset)
+        except OSError:
+            return 0
+
+    def read(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return None
+        if size < self.offset:
+            # Truncated or replaced by a new session
+            self.offset = 0
+            self.header = None
+        if size == self.offset:
+            return None
+        with open(self.path, 'rb') as file:
+            file.seek(self.offset)
+            data = file.read(self.chunk_bytes)
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return None
+        self.offset += end
+        data = data[:end]
+        if self.header is None:
+            header_end = data.index(b'\n') + 1
+            self.header, data = data[:header_end], data[header_end:]
+            if not data:
+                return None
+        frame = pd.read_csv(io.BytesIO(self.header + data), usecols=self.usecols)
+        # Empty CircleDirection outside Circle; compared by value across chunks
+        for column in ['Movement', 'CircleDirection', 'ReferenceFrame']:
+            frame[column] = frame[column].fillna('').astype(str)
+        return frame
+
+### Condition segments
+def _key(frame, row):
+    return tuple(frame[column].iat[row] for column in CONDITION_KEY)
+
+# Starts of the condition segments in frame (a condition restarts SystemClockTimestampMs) and whether the
+# first one continues the condition of the previous chunk; last = (key, SystemClockTimestampMs) of its last row
+def condition_segments(frame, last):
+    timestamps = frame['SystemClockTimestampMs'].to_numpy()
+    changed = np.zeros(len(frame), dtype=bool)
+    changed[0] = True
+    changed[1:] = timestamps[1:] <= timestamps[:-1]
+    for column in CONDITION_KEY:
+        values = frame[column].to_numpy()
+        changed[1:] |= values[1:] != values[:-1]
+    continues = last is not None and last[0] == _key(frame, 0) and timestamps[0] > last[1]
+    return np.flatnonzero(changed), continues
+
+def _new_condition():
+    return {
+        'runs': 0, 'samples': 0, 'first_ms': np.nan, 'last_ms': np.nan, 'head_distance_m': 0.0, 'path_distance_m': 0.0,
+        'steps': 0, 'intervals': 0, 'interval_sum_ms': 0.0, 'last_step_ms': None,
+        'geometry_count': 0, 'Decline_sum': 0.0, 'Depth_sum': 0.0,
+        'selections': 0, 'kept': 0, 'MT_sum': 0.0, 'ae_sum': 0.0, 'dx_sum': 0.0, 'dx_sumsq': 0.0, 'Success_sum': 0.0,
+    }
+
+### Session
+class LiveSession:
+    def __init__(self, directory, participant_id, chunk_bytes=CHUNK_BYTES):
+        self.participant_id = participant_id
+        self.high_frequency = LogTail(os.path.join(directory, f'{participant_id}_{HIGH_FREQUENCY}.csv'), HIGH_FREQUENCY_COLUMNS, chunk_bytes)
+        self.selections = LogTail(os.path.join(directory, f'{participant_id}_{SELECTIONS}.csv'), SELECTION_COLUMNS, chunk_bytes)
+        # Aggregates per condition key, in the order the conditions were first logged
+        self.conditions = {}
+        self.rows = 0
+        self._current = None
+        self._last_sample = None
+        self._last_selection = None
+        self._selection_condition = None
+        self._detector = StreamingStepDetector()
+
+    def _condition(self, key):
+        if key not in self.conditions:
+            self.conditions[key] = _new_condition()
+        return self.conditions[key]
+
+    def _add_steps(self, condition, timestamps):
+        for timestamp in timestamps:
+            if condition['last_step_ms'] is not None:
+                condition['intervals'] += 1
+                condition['interval_sum_ms'] += timestamp - condition['last_step_ms']
+            condition['last_step_ms'] = timestamp
+            condition['steps'] += 1
+
+    def _update_high_frequency(self, frame):
+        starts, continues = condition_segments(frame, None if self._last_sample is None else self._last_sample[:2])
+        head_x, head_z = frame['HeadPositionX'].to_numpy(np.float64), frame['HeadPositionZ'].to_numpy(np.float64)
+        path_x, path_z = frame['WalkingDirectionPositionX'].to_numpy(np.float64), frame['WalkingDirectionPositionZ'].to_numpy(np.float64)
+        head_distance = step_distances(head_x, head_z, starts)
+        path_distance = step_distances(path_x, path_z, starts)
+        if continues:
+            # Distance from the last sample of the previous chunk
+            previous_head, previous_path = self._last_sample[2]
+            head_distance[0] = np.hypot(head_x[0] - previous_head[0], head_z[0] - previous_head[1])
+            path_distance[0] = np.hypot(path_x[0] - previous_path[0], path_z[0] - previous_path[1])
+        geometry = target_geometry(
+            frame['HeadPositionX'], frame['HeadPositionY'], frame['HeadPositionZ'], frame['TrackPositionY'],
+            frame['WalkingDirectionForwardX'], frame['WalkingDirectionForwardZ'],
+            frame['AllTargetsPositionX'], frame['AllTargetsPositionY'], frame['AllTargetsPositionZ'])
+        valid = ~(np.isnan(geometry['Decline']) | np.isnan(geometry['Depth']))
+        sums = {
+            'samples': np.diff(np.append(starts, len(frame))),
+            'head_distance_m': np.add.reduceat(head_distance, starts),
+            'path_distance_m': np.add.reduceat(path_distance, starts),
+            'geometry_count': np.add.reduceat(valid.astype(np.int64), starts),
+            'Decline_sum': np.add.reduceat(np.where(valid, geometry['Decline'], 0), starts),
+            'Depth_sum': np.add.reduceat(np.where(valid, geometry['Depth'], 0), starts),
+        }
+        realtime = frame['RealtimeSinceStartupMs'].to_numpy(np.float64)
+        timestamps = frame['SystemClockTimestampMs'].to_numpy()
+        head_y = frame['HeadPositionY'].to_numpy(np.float64)
+        ends = np.append(starts[1:], len(frame))
+
+        for segment, (start, end) in enumerate(zip(starts, ends)):
+            if segment > 0 or not continues:
+                if self._current is not None:
+                    self._add_steps(self.conditions[self._current], self._detector.finish())
+                    self.conditions[self._current]['last_step_ms'] = None
+                self._current = _key(frame, start)
+                condition = self._condition(self._current)
+                condition['runs'] += 1
+                if np.isnan(condition['first_ms']):
+                    condition['first_ms'] = realtime[start]
+            condition = self.conditions[self._current]
+            for column, values in sums.items():
+                condition[column] += values[segment]
+            condition['last_ms'] = realtime[end - 1]
+            steps = []
+            for timestamp, value in zip(timestamps[start:end].tolist(), head_y[start:end].tolist()):
+                steps += self._detector.push(timestamp, value)
+            self._add_steps(condition, steps)
+
+        last = len(frame) - 1
+        self._last_sample = (_key(frame, last), timestamps[last], ((head_x[last], head_z[last]), (path_x[last], path_z[last])))
+        self.rows += len(frame)
+
+    def _update_selections(self, frame):
+        starts, continues = condition_segments(frame, self._selection_condition)
+        # The last selection of the previous chunk is the previous target of the first new one
+        carried = self._last_selection is not None and continues
+        metrics = add_selection_metrics(pd.concat([self._last_selection, frame], ignore_index=True) if carried else frame.copy())
+        if carried:
+            metrics = metrics.iloc[1:].reset_index(drop=True)
+        kept = ((metrics['SelectionDuration'] != 0) & (metrics['b'] < OUTLIER_CUTOFF)).to_numpy()
+        dx = np.where(kept, metrics['dx'].to_numpy(np.float64), 0)
+        ends = np.append(starts[1:], len(frame))
+        for start, end in zip(starts, ends):
+            condition = self._condition(_key(frame, start))
+            rows = slice(start, end)
+            condition['selections'] += end - start
+            condition['kept'] += int(kept[rows].sum())
+            condition['MT_sum'] += float(metrics['SelectionDuration'].to_numpy(np.float64)[rows][kept[rows]].sum())
+            condition['ae_sum'] += float(metrics['ae'].to_numpy(np.float64)[rows][kept[rows]].sum())
+            condition['Success_sum'] += float(metrics['Success'].to_numpy(np.float64)[rows][kept[rows]].sum())
+            condition['dx_sum'] += float(dx[rows].sum())
+            condition['dx_sumsq'] += float((dx[rows] ** 2).sum())
+        last = len(frame) - 1
+        self._selection_condition = (_key(frame, last), frame['SystemClockTimestampMs'].iat[last])
+        self._last_selection = frame.iloc[[last]].reset_index(drop=True)
+
+    # Reads new rows until both logs are caught up or budget_seconds have passed; returns the bytes still unread
+    def update(self, budget_seconds):
+        deadline = time.perf_counter() + budget_seconds
+        while time.perf_counter() < deadline:
+            read = False
+            for tail, update in [(self.selections, self._update_selections), (self.high_frequency, self._update_high_frequency)]:
+                frame = tail.read()
+                if frame is not None and len(frame):
+                    update(frame)
+                    read = True
+            if not read:
+                break
+        return self.high_frequency.pending() + self.selections.pending()
+
+    # Flushes the step detector at the end of the session
+    def finish(self):
+        if self._current is not None:
+            self._add_steps(self.conditions[self._current], self._detector.finish())
+
+    ### Summary
+    def summary(self):
+        table = pd.DataFrame([{**dict(zip(CONDITION_KEY, key)), **condition} for key, condition in self.conditions.items()],
+                             columns=[*CONDITION_KEY, *_new_condition()])
+        seconds = (table['last_ms'] - table['first_ms']) * 0.001
+        with np.errstate(divide='ignore', invalid='ignore'):
+            kept = table['kept'].replace(0, np.nan)
+            mt = table['MT_sum'] / kept / 1000
+            sdx = np.sqrt(np.maximum(table['dx_sumsq'] - table['dx_sum'] ** 2 / kept, 0) / (kept - 1))
+            ide = np.log2(table['ae_sum'] / kept / (sdx * 4.133) + 1)
+            summary = pd.DataFrame({
+                **{column: table[column] for column in CONDITION_KEY},
+                'runs': table['runs'],
+                'seconds': seconds,
+                'head_speed_km/h': table['head_distance_m'] / seconds * 3.6,
+                'path_speed_km/h': table['path_distance_m'] / seconds * 3.6,
+                'step_frequency': step_frequency(table['interval_sum_ms'].to_numpy(np.float64), table['intervals'].to_numpy()),
+                'Decline': table['Decline_sum'] / table['geometry_count'].replace(0, np.nan),
+                'Depth': table['Depth_sum'] / table['geometry_count'].replace(0, np.nan),
+                'selections': table['selections'],
+                'Success': table['Success_sum'] / kept,
+                'MT': mt,
+                'TP': ide / mt,
+            })
+        summary['current'] = [key == self._current for key in self.conditions]
+        return summary
+
+    # Problems of the conditions logged so far; the running condition is only checked for duplicates
+    def checks(self, summary=None):
+        summary = self.summary() if summary is None else summary
+        problems = []
+        for row in summary.to_dict('records'):
+            name = ' '.join(str(row[column]) for column in CONDITION_KEY if row[column] != '')
+            if row['runs'] > 1:
+                problems.append(f"{name}: logged {row['runs']} times")
+            if row['current']:
+                continue
+            if row['selections'] != SELECTIONS_PER_CELL:
+                problems.append(f"{name}: {row['selections']} selections, expected {SELECTIONS_PER_CELL}")
+            if row['Movement'] != 'Standing' and row['seconds'] >= MINIMUM_CHECK_SECONDS:
+                if not row['path_speed_km/h'] >= MINIMUM_PATH_SPEED:
+                    problems.append(f"{name}: walking track at {row['path_speed_km/h']:.2f} km/h")
+                if not STEP_FREQUENCY_RANGE[0] <= row['step_frequency'] <= STEP_FREQUENCY_RANGE[1]:
+                    problems.append(f"{name}: step frequency {row['step_frequency']:.0f} steps/min")
+        expected = int(np.prod(list(EXPECTED_LEVELS.values())))
+        conditions = summary[['Movement', 'ReferenceFrame', 'TargetSize']].drop_duplicates()
+        for column, levels in EXPECTED_LEVELS.items():
+            if summary[column].nunique() > levels:
+                problems.append(f'{column}: {summary[column].nunique()} levels, expected {levels}')
+        return problems, len(conditions), expected
+
+def print_summary(session, backlog):
+    summary = session.summary()
+    problems, conditions, expected = session.checks(summary)
+    if sys.stdout.isatty():
+        print('\033[H\033[J', end='')
+    print(f'Participant {session.participant_id}: {session.rows} samples, {conditions}/{expected} conditions'
+          + (f', {backlog / 2**20:.1f} MB behind' if backlog else ''))
+    print(summary.drop(columns=['current']).to_string(index=False, float_format='%.2f'))
+    for problem in problems:
+        print('! ' + problem)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory')
+    parser.add_argument('participant', type=int)
+    parser.add_argument('--interval', type=float, default=2, help='seconds between refreshes')
+    parser.add_argument('--budget', type=float, default=0.5, help='seconds of parsing per refresh; a larger backlog is caught up over several refreshes')
+    parser.add_argument('--once', action='store_true', help='catch up with the logs, print the summary and exit')
+    args = parser.parse_args()
+    session = LiveSession(args.directory, args.participant)
+    while True:
+        started = time.perf_counter()
+        backlog = session.update(args.budget)
+        if args.once:
+            if backlog:
+                continue
+            session.finish()
+            print_summary(session, backlog)
+            break
+        print_summary(session, backlog)
+        time.sleep(max(0, args.interval - (time.perf_counter() - started)))
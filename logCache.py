@@ -0,0 +1,106 @@
+import os
+import json
+import hashlib
+
+# Columnar cache of the CSV logs. Each {id}_*.csv is parsed once into an uncompressed Arrow (Feather v2)
+# file that later runs memory-map, reading only the requested columns.
+# Without pyarrow installed the loader falls back to parsing the CSV every time.
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+CACHE_DIRECTORY_NAME = '.analysis_cache'
+CACHE_VERSION = 1
+
+def cache_available():
+    return feather is not None
+
+def default_cache_directory(log_path):
+    return os.path.join(os.path.dirname(os.path.abspath(log_path)), CACHE_DIRECTORY_NAME)
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def schema_key(dtype):
+    return repr(sorted((column, repr(column_dtype)) for column, column_dtype in (dtype or {}).items()))
+
+def _cache_paths(log_path, cache_directory):
+    name = os.path.splitext(os.path.basename(log_path))[0]
+    return os.path.join(cache_directory, name + '.arrow'), os.path.join(cache_directory, name + '.json')
+
+def read_metadata(metadata_path):
+    try:
+        with open(metadata_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def write_atomic(path, write):
+    temporary_path = path + '.tmp' + str(os.getpid())
+    write(temporary_path)
+    os.replace(temporary_path, path)
+
+### Validity
+# size and mtime are checked first; only when they differ is the content hashed, so a touched or
+# re-copied file with unchanged content keeps its cache and just gets its metadata refreshed.
+def source_fingerprint(log_path):
+    stat = os.stat(log_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_hash(log_path)}
+
+# Checks metadata written with source_fingerprint against log_path, refreshing metadata_path if only the mtime moved
+def source_unchanged(metadata, metadata_path, log_path):
+    stat = os.stat(log_path)
+    if metadata['size'] == stat.st_size and metadata['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if metadata['size'] != stat.st_size or metadata['sha256'] != file_hash(log_path):
+        return False
+    metadata['mtime_ns'] = stat.st_mtime_ns
+    write_metadata(metadata, metadata_path)
+    return True
+
+def is_valid(log_path, cache_directory, dtype=None):
+    data_path, metadata_path = _cache_paths(log_path, cache_directory)
+    metadata = read_metadata(metadata_path)
+    if metadata is None or not os.path.exists(data_path):
+        return False
+    if metadata.get('version') != CACHE_VERSION or metadata.get('schema') != schema_key(dtype):
+        return False
+    return source_unchanged(metadata, metadata_path, log_path)
+
+def _dump_metadata(metadata, path):
+    with open(path, 'w') as file:
+        json.dump(metadata, file)
+
+def write_metadata(metadata, metadata_path):
+    write_atomic(metadata_path, lambda path: _dump_metadata(metadata, path))
+
+### Build
+# parse(log_path) must return the full DataFrame for the log, parsed with dtype
+def build(log_path, cache_directory, parse, dtype=None):
+    os.makedirs(cache_directory, exist_ok=True)
+    data_path, metadata_path = _cache_paths(log_path, cache_directory)
+    metadata = {
+        'version': CACHE_VERSION,
+        'source': os.path.basename(log_path),
+        **source_fingerprint(log_path),
+        'schema': schema_key(dtype),
+    }
+    data = parse(log_path)
+    write_atomic(data_path, lambda path: feather.write_feather(data, path, compression='uncompressed'))
+    write_metadata(metadata, metadata_path)
+    return data
+
+### Read
+def read(log_path, parse, usecols=None, dtype=None, cache_directory=None):
+    cache_directory = default_cache_directory(log_path) if cache_directory is None else cache_directory
+    if not is_valid(log_path, cache_directory, dtype):
+        data = build(log_path, cache_directory, parse, dtype)
+        return data if usecols is None else data[[column for column in data.columns if column in usecols]]
+    data_path, _ = _cache_paths(log_path, cache_directory)
+    columns = None if usecols is None else [column for column in feather.read_table(data_path, memory_map=True).column_names if column in usecols]
+    return feather.read_feather(data_path, columns=columns, memory_map=True)
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import kurtosis, shapiro, skew
+from participantLoader import map_participants, worker_count
+
+# Normality checks of the Data Analysis steps at the end of data-preprocess.py: Shapiro-Wilk per condition
+# (within-subject designs are checked independently for each condition) and skewness / kurtosis to decide
+# on a transformation (https://rpubs.com/frasermyers/627589). All condition x dependent variable tests are
+# spread over a process pool, a batch of tests per worker.
+
+CONDITION_FACTORS = ['Movement', 'ReferenceFrame', 'TargetSize']
+ALPHA = 0.05
+
+# Transformation suggested for positively skewed data; negative skew is reflected first
+def suggested_transformation(skewness):
+    magnitude = abs(skewness)
+    if np.isnan(magnitude) or magnitude < 0.5:
+        return 'none'
+    transformation = 'sqrt' if magnitude < 1 else 'log' if magnitude < 2 else 'inverse'
+    return transformation if skewness > 0 else 'reflect+' + transformation
+
+def _test(values):
+    values = values[~np.isnan(values)]
+    if len(values) < 3:
+        return len(values), np.nan, np.nan, np.nan, np.nan
+    w, p = shapiro(values)
+    return len(values), w, p, skew(values, bias=False), kurtosis(values, bias=False)
+
+def _test_batch(batch):
+    return [_test(values) for values in batch]
+
+# One row per condition x dependent variable: n, Shapiro-Wilk W and p, sample skewness, excess kurtosis,
+# Normal (p >= alpha) and the suggested transformation
+def normality_table(data, dependent_variables, factors=CONDITION_FACTORS, alpha=ALPHA, workers=None):
+    keys = []
+    tasks = []
+    for condition, group in data.groupby(factors, observed=True, sort=True):
+        for dependent_variable in dependent_variables:
+            keys.append((*condition, dependent_variable))
+            tasks.append(group[dependent_variable].to_numpy(dtype=np.float64))
+
+    batch_count = max(1, min(worker_count(workers), len(tasks)))
+    batches = [tasks[i::batch_count] for i in range(batch_count)]
+    results = [None] * len(tasks)
+    for i, batch_results in enumerate(map_participants(_test_batch, batches, workers)):
+        results[i::batch_count] = batch_results
+
+    table = pd.DataFrame(keys, columns=[*factors, 'DependentVariable'])
+    table[['n', 'W', 'p', 'Skewness', 'Kurtosis']] = pd.DataFrame(results, columns=['n', 'W', 'p', 'Skewness', 'Kurtosis'])
+    table['n'] = table['n'].astype(int)
+    table['Normal'] = table['p'] >= alpha
+    table['Transformation'] = table['Skewness'].map(suggested_transformation)
+    return table
+
+# Number of conditions with p < alpha per dependent variable
+def non_normal_counts(table, alpha=ALPHA):
+    return (table['p'] < alpha).groupby(table['DependentVariable'], sort=False).sum()
@@ -0,0 +1,142 @@
+import os
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import logCache
+
+# Shared loader for the {id}_selections.csv and {id}_highFrequency.csv logs written by ExperimentManager.cs
+
+SELECTIONS = 'selections'
+HIGH_FREQUENCY = 'highFrequency'
+
+CONDITION_COLUMNS = ['Movement', 'ReferenceFrame', 'CircleDirection', 'TargetSize']
+
+# Enums in ExperimentManager.cs (categories kept in alphabetical order, as astype('category') would give).
+# TargetSize is a float diameter and gets its categories from the data.
+CONDITION_DTYPES = {
+    'Movement': pd.CategoricalDtype(['Circle', 'Standing', 'Walking']),
+    'ReferenceFrame': pd.CategoricalDtype(['PalmReferenced', 'PalmWORotation', 'PathReferenced']),
+    'CircleDirection': pd.CategoricalDtype(['Clockwise', 'CounterClockwise']),
+    'TargetSize': 'category',
+    'DominantHand': pd.CategoricalDtype(['Left', 'Right']),
+}
+
+# Objects logged with LogObjectTransform in ExperimentManager.cs
+POSE_OBJECTS = ['Track', 'WalkingDirection', 'Head', 'DominantPalmCenter', 'DominantIndexTip', 'Controller', 'AllTargets', 'ActiveTarget']
+POSE_COMPONENTS = ['PositionX', 'PositionY', 'PositionZ', 'ForwardX', 'ForwardY', 'ForwardZ', 'UpX', 'UpY', 'UpZ',
+                   'QuaternionX', 'QuaternionY', 'QuaternionZ', 'QuaternionW']
+POSE_COLUMNS = [pose_object + component for pose_object in POSE_OBJECTS for component in POSE_COMPONENTS]
+
+SELECTION_DTYPES = {
+    **CONDITION_DTYPES,
+}
+
+HIGH_FREQUENCY_DTYPES = {
+    **CONDITION_DTYPES,
+    'MeasurementID': 'int32',
+    'ActiveTargetIndex': 'int8',
+    'IsSelectorInsideCollider': 'int8',
+    **{column: 'float32' for column in POSE_COLUMNS},
+    'SelectorProjectionOntoAllTargetsX': 'float32',
+    'SelectorProjectionOntoAllTargetsY': 'float32',
+    'ActiveTargetInsideAllTargetsX': 'float32',
+    'ActiveTargetInsideAllTargetsY': 'float32',
+    'DistanceFromSelectorToAllTargetsOXYPlane': 'float32',
+}
+
+DEFAULT_DTYPES = {
+    SELECTIONS: SELECTION_DTYPES,
+    HIGH_FREQUENCY: HIGH_FREQUENCY_DTYPES,
+}
+
+_FILE_NAME = re.compile(r'^(\d+)_(' + SELECTIONS + '|' + HIGH_FREQUENCY + r')\.csv$')
+
+### File discovery
+# Lists the directory once and returns {kind: {participant_id: path}}
+def discover_participant_files(directory):
+    files = {SELECTIONS: {}, HIGH_FREQUENCY: {}}
+    for file_name in os.listdir(directory):
+        match = _FILE_NAME.match(file_name)
+        if match:
+            files[match.group(2)][int(match.group(1))] = os.path.join(directory, file_name)
+    return files
+
+def participant_files(directory, kind, participant_start, participant_end):
+    found = discover_participant_files(directory)[kind]
+    return [(participant_id, found[participant_id]) for participant_id in range(participant_start, participant_end + 1) if participant_id in found]
+
+### Pool used by every per-participant fan-out
+# The analysis scripts run at module level, so workers are forked rather than spawned (spawning would
+# re-run the calling script in every worker). Where fork is unavailable the work runs in-process.
+def worker_count(workers=None):
+    return (os.cpu_count() or 1) if workers is None else max(1, workers)
+
+def map_participants(function, items, workers=None):
+    items = list(items)
+    workers = min(worker_count(workers), len(items))
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return [function(item) for item in items]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+        return list(executor.map(function, items))
+
+### Parsing
+def numeric_categories(data):
+    # TargetSize is logged as a number; keep numeric categories so it orders and prints like the raw float
+    for column in data.columns:
+        if isinstance(data[column].dtype, pd.CategoricalDtype):
+            categories = pd.to_numeric(data[column].cat.categories, errors='coerce')
+            if len(categories) and not np.isnan(categories).any():
+                data[column] = data[column].cat.rename_categories(categories)
+    return data
+
+def _project_dtype(dtype, usecols):
+    if dtype is None or usecols is None:
+        return dtype
+    return {column: column_dtype for column, column_dtype in dtype.items() if column in usecols}
+
+def _parse_log(path, usecols=None, dtype=None):
+    dtype = _project_dtype(dtype, usecols)
+    return numeric_categories(pd.read_csv(path, usecols=usecols, dtype=dtype))
+
+# With cache=True the whole log is converted once into logCache and later reads load only usecols
+def read_log(path, usecols=None, dtype=None, cache=False, cache_directory=None):
+    if cache and logCache.cache_available():
+        return logCache.read(path, lambda log_path: _parse_log(log_path, dtype=dtype), usecols, dtype, cache_directory)
+    return _parse_log(path, usecols, dtype)
+
+def _read_log_args(args):
+    return read_log(*args)
+
+def concat_logs(frames):
+    frames = [frame for frame in frames if len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    # Data-driven categories (TargetSize) can differ between files, so align them before the
+    # single concatenation to keep the columns categorical
+    for column in frames[0].columns:
+        if all(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames):
+            categories = sorted(set().union(*(frame[column].cat.categories for frame in frames)))
+            for frame in frames:
+                frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+# Reads a log in chunks of chunk_size rows, for constant-memory passes over large logs
+def iter_log_chunks(path, chunk_size, usecols=None, dtype=None):
+    dtype = _project_dtype(dtype, usecols)
+    with pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            yield numeric_categories(chunk)
+
+### Loading
+# kind is SELECTIONS or HIGH_FREQUENCY; dtype defaults to the schema for that kind
+def load_participants(directory, kind, participant_start, participant_end, usecols=None, dtype=None, workers=None, verbose=False,
+                      cache=False, cache_directory=None):
+    dtype = DEFAULT_DTYPES[kind] if dtype is None else dtype
+    paths = participant_files(directory, kind, participant_start, participant_end)
+    if verbose:
+        for participant_id, _ in paths:
+            print(f'Processing participant {participant_id}')
+    frames = map_participants(_read_log_args, [(path, usecols, dtype, cache, cache_directory) for _, path in paths], workers)
+    return concat_logs(frames)
@@ -0,0 +1,133 @@
+import argparse
+import numpy as np
+import pandas as pd
+from conditionIndex import segment_diff, segment_first, segment_ids, segment_mean
+from gaitMetrics import condition_starts, CONDITION_COLUMNS
+from participantLoader import concat_logs, map_participants, participant_files, read_log, HIGH_FREQUENCY, HIGH_FREQUENCY_DTYPES
+
+# Batched quaternion maths on the <object>Quaternion{X,Y,Z,W} columns of the high-frequency log (Unity
+# order x, y, z, w) and per-condition angular velocity / rotational jitter. Quaternions are (n, 4) arrays;
+# everything between consecutive samples is computed within condition segments, never across them.
+
+COMPONENTS = ['QuaternionX', 'QuaternionY', 'QuaternionZ', 'QuaternionW']
+# Head, hand and the target panel (anchored to the palm, the palm position or the path by ReferenceFrame)
+ANGULAR_OBJECTS = ['Head', 'DominantPalmCenter', 'AllTargets']
+
+def quaternion_array(data, pose_object):
+    return data[[pose_object + component for component in COMPONENTS]].to_numpy(dtype=np.float64)
+
+### Quaternion algebra
+# Zero quaternions (e.g. untracked objects) become NaN
+def normalize(q):
+    norm = np.linalg.norm(q, axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(norm > 0, q / norm, np.nan)
+
+def conjugate(q):
+    return q * np.array([-1, -1, -1, 1])
+
+def multiply(a, b):
+    ax, ay, az, aw = a.T
+    bx, by, bz, bw = b.T
+    return np.column_stack([
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+        aw * bw - ax * bx - ay * by - az * bz,
+    ])
+
+# Rotation from a to b, expressed in the frame of a (conjugate(a) * b for unit quaternions)
+def relative_rotation(a, b):
+    return multiply(conjugate(a), b)
+
+# Rotation angle in radians, in [0, pi]; q and -q give the same angle
+def rotation_angle(q):
+    return 2 * np.arctan2(np.linalg.norm(q[:, :3], axis=1), np.abs(q[:, 3]))
+
+# Rotation vector (axis * angle, radians) on the shorter arc
+def rotation_vector(q):
+    q = np.where(q[:, 3:] < 0, -q, q)
+    sine = np.linalg.norm(q[:, :3], axis=1)
+    angle = 2 * np.arctan2(sine, q[:, 3])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # angle / sin(angle / 2) -> 2 for small angles
+        scale = np.where(sine > 1e-12, angle / sine, 2.0)
+    return q[:, :3] * scale[:, None]
+
+### Consecutive samples within segments
+def _previous(values, starts):
+    previous = np.empty_like(values)
+    previous[1:] = values[:-1]
+    previous[starts] = np.nan
+    return previous
+
+# Angle (radians) between every sample and the previous one of its segment; NaN for the first sample
+def consecutive_angles(q, starts):
+    q = normalize(q)
+    return rotation_angle(relative_rotation(_previous(q, starts), q))
+
+# Angular velocity (rad/s) in the local frame of the object from consecutive samples and their timestamps
+# (ms); NaN for the first sample of a segment and for repeated timestamps
+def angular_velocity(q, timestamps, starts):
+    q = normalize(q)
+    dt = segment_diff(np.asarray(timestamps, dtype=np.float64), starts, fill=np.nan) * 0.001
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return rotation_vector(relative_rotation(_previous(q, starts), q)) / np.where(dt > 0, dt, np.nan)[:, None]
+
+# Change of the angular velocity between consecutive samples (rad/s^2); NaN for the first two samples of a segment
+def angular_acceleration(velocity, timestamps, starts):
+    dt = segment_diff(np.asarray(timestamps, dtype=np.float64), starts, fill=np.nan) * 0.001
+    change = velocity - _previous(velocity, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return change / np.where(dt > 0, dt, np.nan)[:, None]
+
+### Per condition
+# One row per condition with, for every object, the mean and 95th percentile angular speed (deg/s) and
+# the rotational jitter: RMS angular acceleration (deg/s^2), dominated by frame-to-frame shaking rather
+# than by slow turns
+def condition_angular_metrics(data, objects=ANGULAR_OBJECTS, starts=None):
+    starts = condition_starts(data) if starts is None else starts
+    timestamps = data['SystemClockTimestampMs'].to_numpy()
+    result = pd.DataFrame({column: segment_first(data[column], starts) for column in CONDITION_COLUMNS})
+    segment = segment_ids(starts, len(data))
+    for pose_object in objects:
+        velocity = angular_velocity(quaternion_array(data, pose_object), timestamps, starts)
+        speed = np.rad2deg(np.linalg.norm(velocity, axis=1))
+        acceleration = np.rad2deg(np.linalg.norm(angular_acceleration(velocity, timestamps, starts), axis=1))
+        result[pose_object + 'AngularSpeed'] = segment_mean(speed, starts)
+        # Percentile per segment from one sort by (segment, speed); NaN speeds sort last in their segment
+        order = np.lexsort((speed, segment))
+        counts = np.bincount(segment, weights=~np.isnan(speed), minlength=len(starts)).astype(np.int64)
+        position = np.floor(0.95 * np.maximum(counts - 1, 0)).astype(np.int64)
+        result[pose_object + 'AngularSpeedP95'] = np.where(counts > 0, speed[order][starts + position], np.nan)
+        result[pose_object + 'Jitter'] = np.sqrt(segment_mean(acceleration ** 2, starts))
+    return result
+
+# Mean per reference frame x movement, e.g. how much the target panel shakes under each reference frame
+def reference_frame_summary(conditions, objects=ANGULAR_OBJECTS):
+    columns = [pose_object + metric for pose_object in objects for metric in ['AngularSpeed', 'Jitter']]
+    return conditions.groupby(['ReferenceFrame', 'Movement'], observed=True)[columns].mean()
+
+### Per participant / study
+ANGULAR_COLUMNS = [
+    'ParticipantID', 'Movement', 'ReferenceFrame', 'TargetSize', 'SystemClockTimestampMs',
+    *(pose_object + component for pose_object in ANGULAR_OBJECTS for component in COMPONENTS),
+]
+
+def participant_angular_metrics(path):
+    return condition_angular_metrics(read_log(path, ANGULAR_COLUMNS, HIGH_FREQUENCY_DTYPES, cache=True))
+
+def study_angular_metrics(directory, participant_start, participant_end, workers=None):
+    paths = participant_files(directory, HIGH_FREQUENCY, participant_start, participant_end)
+    return concat_logs(map_participants(participant_angular_metrics, [path for _, path in paths], workers))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory')
+    parser.add_argument('--participants', type=int, nargs=2, metavar=('START', 'END'), default=[5, 28])
+    parser.add_argument('--workers', type=int, help='participants processed in parallel (default: all cores)')
+    args = parser.parse_args()
+    participant_start, participant_end = args.participants
+    conditions = study_angular_metrics(args.directory, participant_start, participant_end, args.workers)
+    conditions.to_csv(str(participant_start) + "-" + str(participant_end) + "_" + "angular_velocity.csv", index=False)
+    print(reference_frame_summary(conditions).to_string(float_format='%.2f'))
@@ -0,0 +1,53 @@
+from itertools import combinations
+import numpy as np
+import pandas as pd
+from scipy.stats import friedmanchisquare, wilcoxon
+
+# Subjective questionnaire of charts-subjective.py: one row per participant with the NASA-TLX scales of
+# every reference frame in columns '<frame>', '<frame>2' ... '<frame>6' and the preference ranking as one
+# ';'-separated list (best first), which becomes '<frame>7'.
+
+REFERENCE_FRAMES = ['Palm', 'Palm w/o Rotation', 'Path']
+SCALES = ['Mental Demand', 'Physical Demand', 'Temporal Demand', 'Performance', 'Effort', 'Frustration', 'Preference']
+RANKING_COLUMN = "Please arrange the following reference frames in order of preference (the higher in the list the better):"
+
+def scale_column(frame, scale):
+    index = SCALES.index(scale) + 1
+    return frame + (str(index) if index != 1 else "")
+
+### Reshaping
+# '<frame>7' = position of the frame in the ranking (1 = preferred); the ranking column is split once
+def add_preference_ranks(data):
+    ranking = data[RANKING_COLUMN].str.split(';', expand=True).to_numpy()
+    for frame in REFERENCE_FRAMES:
+        ranked = ranking == frame
+        # Frames missing from a ranking get NaN
+        data[scale_column(frame, 'Preference')] = np.where(ranked.any(axis=1), ranked.argmax(axis=1) + 1, np.nan)
+    return data
+
+# One row per participant x reference frame with a column per scale (participant-major, frames in
+# REFERENCE_FRAMES order)
+def long_format(data):
+    columns = [scale_column(frame, scale) for frame in REFERENCE_FRAMES for scale in SCALES]
+    values = data[columns].to_numpy().reshape(len(data) * len(REFERENCE_FRAMES), len(SCALES))
+    long = pd.DataFrame(values, columns=SCALES)
+    long.insert(0, 'Reference Frame', np.tile(REFERENCE_FRAMES, len(data)))
+    long.insert(0, 'Participant', np.repeat(np.arange(len(data)), len(REFERENCE_FRAMES)))
+    return long.infer_objects()
+
+### Tests
+# Friedman test over the reference frames and all pairwise Wilcoxon signed-rank tests (with Bonferroni
+# adjusted p) for every scale, each computed for all scales in one vectorized call
+def scale_tests(data, scales=SCALES):
+    values = {frame: data[[scale_column(frame, scale) for scale in scales]].to_numpy(dtype=np.float64) for frame in REFERENCE_FRAMES}
+    pairs = list(combinations(REFERENCE_FRAMES, 2))
+    friedman = friedmanchisquare(*values.values(), axis=0)
+    tables = [pd.DataFrame({'Scale': scales, 'Test': 'Friedman', 'Pair': '', 'Statistic': friedman.statistic, 'p': friedman.pvalue,
+                            'p_bonferroni': friedman.pvalue})]
+    for first, second in pairs:
+        result = wilcoxon(values[first], values[second], axis=0)
+        tables.append(pd.DataFrame({'Scale': scales, 'Test': 'Wilcoxon', 'Pair': first + ' - ' + second, 'Statistic': result.statistic,
+                                    'p': result.pvalue, 'p_bonferroni': np.minimum(result.pvalue * len(pairs), 1)}))
+    tests = pd.concat(tables, ignore_index=True)
+    tests['Scale'] = pd.Categorical(tests['Scale'], scales)
+    return tests.sort_values(['Scale'], kind='stable').reset_index(drop=True)
@@ -0,0 +1,122 @@
+import time
+import asyncio
+import argparse
+import numpy as np
+import pandas as pd
+from participantLoader import participant_files, SELECTIONS, HIGH_FREQUENCY
+from ingestServer import DEFAULT_PORT, LOG_COLUMNS
+
+# Streams existing {id}_selections.csv / {id}_highFrequency.csv logs to ingestServer.py, one simulated
+# headset per participant, e.g. python replayClient.py <directory> --participants 5 28 --rate 10
+# Rows are sent on the RealtimeSinceStartupMs clock of the session, scaled by --rate (0: as fast as
+# possible), so the ingest throughput can be measured without hardware.
+
+# Rows sent at once at most, and UDP payload limit
+SEND_ROWS = 500
+DATAGRAM_BYTES = 60000
+# The END datagram of a UDP log is repeated, so losing one still lets the server count trailing losses
+END_REPEATS = 3
+END_INTERVAL_SECONDS = 0.1
+
+def _read_log(path):
+    with open(path, 'rb') as file:
+        header = file.readline()
+        rows = file.read().splitlines(keepends=True)
+    realtime = pd.read_csv(path, usecols=['RealtimeSinceStartupMs'])['RealtimeSinceStartupMs'].to_numpy(np.float64)
+    return header, rows, realtime
+
+# Index after the rows due at elapsed seconds (all remaining rows with rate 0)
+def _due(realtime, start_ms, rate, elapsed):
+    if rate == 0:
+        return len(realtime)
+    return int(np.searchsorted(realtime, start_ms + elapsed * 1000 * rate, side='right'))
+
+async def _send_tcp(host, port, participant_id, kind, header, rows, schedule, stats):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f'HELLO {participant_id} {kind}\n'.encode() + header)
+    sent = 0
+    async for end in schedule:
+        while sent < end:
+            batch_end = min(end, sent + SEND_ROWS)
+            writer.write(b''.join(rows[sent:batch_end]))
+            sent = batch_end
+            start = time.perf_counter()
+            # Waits while the server is not reading (backpressure)
+            await writer.drain()
+            stats['blocked_seconds'] += time.perf_counter() - start
+    writer.close()
+    await writer.wait_closed()
+
+async def _send_udp(host, port, participant_id, kind, header, rows, schedule, stats):
+    if header.decode().strip().split(',') != LOG_COLUMNS[kind]:
+        raise ValueError(f'UDP rows must follow the column order of ExperimentManager.cs ({participant_id}_{kind}.csv does not)')
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(host, port))
+    sent = 0
+    async for end in schedule:
+        while sent < end:
+            prefix = f'ROWS {participant_id} {kind} {sent}\n'.encode()
+            size = len(prefix)
+            batch_end = sent
+            while batch_end < end and (batch_end == sent or size + len(rows[batch_end]) <= DATAGRAM_BYTES):
+                size += len(rows[batch_end])
+                batch_end += 1
+            transport.sendto(prefix + b''.join(rows[sent:batch_end]))
+            sent = batch_end
+        # Let the event loop run between bursts
+        await asyncio.sleep(0)
+    for _ in range(END_REPEATS):
+        await asyncio.sleep(END_INTERVAL_SECONDS)
+        transport.sendto(f'END {participant_id} {kind} {len(rows)}\n'.encode())
+    transport.close()
+
+async def _schedule(realtime, start_ms, rate, started, stats):
+    sent = 0
+    while sent < len(realtime):
+        elapsed = time.perf_counter() - started
+        end = _due(realtime, start_ms, rate, elapsed)
+        if end > sent:
+            stats['max_lag_seconds'] = max(stats['max_lag_seconds'], elapsed - (realtime[sent] - start_ms) / 1000 / rate if rate else 0)
+            stats['rows'] += end - sent
+            sent = end
+            yield end
+        else:
+            await asyncio.sleep(max(0.0, (realtime[sent] - start_ms) / 1000 / rate - elapsed))
+
+async def replay_participant(directory, participant_id, host, port, rate, protocol):
+    logs = {}
+    for kind in [SELECTIONS, HIGH_FREQUENCY]:
+        paths = participant_files(directory, kind, participant_id, participant_id)
+        if paths:
+            logs[kind] = await asyncio.get_running_loop().run_in_executor(None, _read_log, paths[0][1])
+    # Both logs share the session clock
+    start_ms = min(realtime[0] for _, _, realtime in logs.values() if len(realtime))
+    send = _send_tcp if protocol == 'tcp' else _send_udp
+    started = time.perf_counter()
+    stats = {}
+    tasks = []
+    for kind, (header, rows, realtime) in logs.items():
+        stats[kind] = {'participant': participant_id, 'kind': kind, 'rows': 0, 'max_lag_seconds': 0.0, 'blocked_seconds': 0.0}
+        tasks.append(send(host, port, participant_id, kind, header, rows, _schedule(realtime, start_ms, rate, started, stats[kind]), stats[kind]))
+    await asyncio.gather(*tasks)
+    for kind_stats in stats.values():
+        kind_stats['seconds'] = time.perf_counter() - started
+    return list(stats.values())
+
+async def replay(directory, participant_start, participant_end, host, port, rate, protocol):
+    participant_ids = [participant_id for participant_id, _ in participant_files(directory, HIGH_FREQUENCY, participant_start, participant_end)]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(replay_participant(directory, participant_id, host, port, rate, protocol) for participant_id in participant_ids))
+    return pd.DataFrame([log for result in results for log in result]), time.perf_counter() - started
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory')
+    parser.add_argument('--participants', type=int, nargs=2, metavar=('START', 'END'), default=[5, 28])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--rate', type=float, default=1, help='replay speed relative to the session clock; 0 sends as fast as possible')
+    parser.add_argument('--protocol', choices=['tcp', 'udp'], default='tcp')
+    args = parser.parse_args()
+    logs, seconds = asyncio.run(replay(args.directory, *args.participants, args.host, args.port, args.rate, args.protocol))
+    print(logs.to_string(index=False, float_format='%.2f'))
+    print(f"{logs['rows'].sum()} rows in {seconds:.1f} s ({logs['rows'].sum() / seconds:.0f} rows/s)")
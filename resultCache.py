@@ -0,0 +1,54 @@
+import os
+import pickle
+import logCache
+
+# Per-participant store of derived results (per-condition aggregates, per-selection Fitts metrics).
+# An entry is reused while its source log is unchanged (size / mtime / SHA-256, see logCache) and the
+# stage's pipeline version matches, so a run only recomputes new or changed participants.
+# Bump a stage's version whenever its computation changes.
+
+RESULTS_DIRECTORY_NAME = 'results'
+
+def default_results_directory(source_path):
+    return os.path.join(logCache.default_cache_directory(source_path), RESULTS_DIRECTORY_NAME)
+
+def _entry_paths(stage, source_path, results_directory):
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    directory = os.path.join(results_directory, stage)
+    return os.path.join(directory, name + '.pkl'), os.path.join(directory, name + '.json')
+
+def is_valid(stage, version, source_path, results_directory=None):
+    results_directory = default_results_directory(source_path) if results_directory is None else results_directory
+    result_path, metadata_path = _entry_paths(stage, source_path, results_directory)
+    metadata = logCache.read_metadata(metadata_path)
+    if metadata is None or not os.path.exists(result_path) or metadata.get('version') != version:
+        return False
+    return logCache.source_unchanged(metadata, metadata_path, source_path)
+
+def store(stage, version, source_path, result, results_directory=None, fingerprint=None):
+    results_directory = default_results_directory(source_path) if results_directory is None else results_directory
+    result_path, metadata_path = _entry_paths(stage, source_path, results_directory)
+    os.makedirs(os.path.dirname(result_path), exist_ok=True)
+    metadata = {'stage': stage, 'version': version, 'source': os.path.basename(source_path), **(fingerprint or logCache.source_fingerprint(source_path))}
+
+    def dump(path):
+        with open(path, 'wb') as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+    logCache.write_atomic(result_path, dump)
+    logCache.write_metadata(metadata, metadata_path)
+
+def load(stage, source_path, results_directory=None):
+    results_directory = default_results_directory(source_path) if results_directory is None else results_directory
+    result_path, _ = _entry_paths(stage, source_path, results_directory)
+    with open(result_path, 'rb') as file:
+        return pickle.load(file)
+
+# compute(source_path) runs only when there is no valid entry (or recompute is set)
+def load_or_compute(stage, version, source_path, compute, results_directory=None, recompute=False):
+    if not recompute and is_valid(stage, version, source_path, results_directory):
+        return load(stage, source_path, results_directory)
+    # Fingerprint before computing, so a log that grows meanwhile is recomputed next time
+    fingerprint = logCache.source_fingerprint(source_path)
+    result = compute(source_path)
+    store(stage, version, source_path, result, results_directory, fingerprint)
+    return result
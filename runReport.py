@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import logCache
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Stage-level instrumentation of the analysis scripts, enabled with --report FILE (and --profile DIR).
+# A script marks consecutive stages with report.stage(name); every stage records its wall time, peak RSS,
+# the memory of the DataFrames passed to report.frame() and the rows in / out of every report.filter().
+# The JSON report is written when the script exits, also on sys.exit() after a batch mode.
+# Without --report every call is a no-op (filter() still filters).
+
+REPORT_VERSION = 1
+
+def add_report_arguments(parser):
+    parser.add_argument('--report', metavar='FILE', help='write a JSON run report with time, memory and row counts per stage')
+    parser.add_argument('--profile', metavar='DIR', help='with --report, also write a cProfile <n>_<stage>.prof file per stage into DIR')
+
+def from_arguments(args):
+    return RunReport(args.report, args.profile)
+
+### Memory
+# Linux keeps the peak RSS (VmHWM) resettable per stage; elsewhere the peak over the whole run is reported
+def _reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+def _status_mb(field):
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _max_rss_mb(who):
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    return resource.getrusage(who).ru_maxrss / (2**20 if sys.platform == 'darwin' else 1024)
+
+def peak_rss_mb():
+    peak = _status_mb('VmHWM')
+    if peak is None and resource is not None:
+        peak = _max_rss_mb(resource.RUSAGE_SELF)
+    return peak
+
+def frame_memory_mb(frame):
+    return float(frame.memory_usage(index=True, deep=True).sum()) / 2**20
+
+### Report
+class RunReport:
+    def __init__(self, path=None, profile_directory=None):
+        self.path = path
+        self.enabled = path is not None
+        self.profile_directory = profile_directory if self.enabled else None
+        self.stages = []
+        self._current = None
+        self._profiler = None
+        self._started = time.time()
+        self._start = time.perf_counter()
+        if self.enabled:
+            if self.profile_directory:
+                os.makedirs(self.profile_directory, exist_ok=True)
+            atexit.register(self.write)
+
+    # Ends the running stage and starts the next one
+    def stage(self, name):
+        if not self.enabled:
+            return
+        self.end()
+        _reset_peak_rss()
+        self._current = {'name': name, 'seconds': None, 'peak_rss_mb': None, 'frames': {}, 'filters': [], '_start': time.perf_counter()}
+        if self.profile_directory:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def end(self):
+        if not self.enabled or self._current is None:
+            return
+        stage = self._current
+        if self._profiler is not None:
+            self._profiler.disable()
+            stage['profile'] = os.path.join(self.profile_directory, f"{len(self.stages) + 1}_{stage['name'].replace(' ', '_')}.prof")
+            self._profiler.dump_stats(stage['profile'])
+            self._profiler = None
+        stage['seconds'] = time.perf_counter() - stage.pop('_start')
+        stage['peak_rss_mb'] = peak_rss_mb()
+        stage['rss_mb'] = _status_mb('VmRSS')
+        # Largest worker process so far (pools of map_participants)
+        stage['children_peak_rss_mb'] = _max_rss_mb(resource.RUSAGE_CHILDREN) if resource else None
+        self.stages.append(stage)
+        self._current = None
+
+    # Rows, columns and deep memory of a DataFrame produced in the running stage
+    def frame(self, name, frame):
+        if self.enabled and self._current is not None:
+            self._current['frames'][name] = {'rows': len(frame), 'columns': len(frame.columns), 'memory_mb': frame_memory_mb(frame)}
+        return frame
+
+    # data[mask], recording the rows kept and dropped under name (e.g. 'SelectionDuration != 0')
+    def filter(self, name, data, mask):
+        filtered = data[mask]
+        if self.enabled and self._current is not None:
+            self._current['filters'].append({'name': name, 'rows_in': len(data), 'rows_out': len(filtered), 'dropped': len(data) - len(filtered)})
+        return filtered
+
+    # Peak over the whole run: the stage peaks and the current VmHWM (ru_maxrss is reset with it by
+    # _reset_peak_rss, so it only covers the last stage)
+    def peak_rss_mb(self):
+        peaks = [stage['peak_rss_mb'] for stage in self.stages if stage['peak_rss_mb'] is not None]
+        current = peak_rss_mb()
+        if current is not None:
+            peaks.append(current)
+        return max(peaks) if peaks else None
+
+    def to_dict(self):
+        return {
+            'version': REPORT_VERSION,
+            'script': os.path.basename(sys.argv[0]),
+            'arguments': sys.argv[1:],
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self._started)),
+            'seconds': time.perf_counter() - self._start,
+            'peak_rss_mb': self.peak_rss_mb(),
+            'stages': self.stages,
+        }
+
+    def write(self):
+        if not self.enabled:
+            return
+        self.end()
+        report = self.to_dict()
+
+        def dump(path):
+            with open(path, 'w') as file:
+                json.dump(report, file, indent=2)
+        logCache.write_atomic(self.path, dump)
@@ -0,0 +1,162 @@
+import argparse
+import numpy as np
+import pandas as pd
+from conditionIndex import run_starts, segment_ids, segment_lengths, timestamp_segments
+from participantLoader import concat_logs, map_participants, participant_files, read_log, HIGH_FREQUENCY, HIGH_FREQUENCY_DTYPES, SELECTIONS, SELECTION_DTYPES
+from quaternions import normalize, COMPONENTS
+from targetGeometry import relative_target_angles, target_geometry
+
+# Pose at the moment of every selection: {id}_selections.csv rows are aligned to the {id}_highFrequency.csv
+# samples of the same condition by SystemClockTimestampMs (which restarts with every condition), and the
+# pose is linearly interpolated between the samples before and after the selection. The join is one
+# searchsorted of the selection keys (condition segment, timestamp) into the sorted sample keys, so the
+# whole study is O(n log n) without per-selection loops. Decline, Depth, LateralShift and the relative
+# target angles are then computed from the interpolated pose, as computeDependentVariables.py does per sample.
+
+CONDITION_KEY = ['ParticipantID', 'Movement', 'CircleDirection', 'ReferenceFrame', 'TargetSize']
+
+POSITION_COLUMNS = [pose_object + 'Position' + axis for pose_object in ['Head', 'DominantPalmCenter', 'AllTargets'] for axis in 'XYZ']
+VECTOR_COLUMNS = [
+    *POSITION_COLUMNS, 'TrackPositionY', 'HeadForwardX', 'HeadForwardY', 'HeadForwardZ',
+    'WalkingDirectionForwardX', 'WalkingDirectionForwardZ', 'AllTargetsForwardX', 'AllTargetsForwardY', 'AllTargetsForwardZ',
+]
+QUATERNION_OBJECTS = ['Head', 'DominantPalmCenter', 'AllTargets']
+POSE_COLUMNS = [*VECTOR_COLUMNS, *(pose_object + component for pose_object in QUATERNION_OBJECTS for component in COMPONENTS)]
+
+### Matching condition segments
+# Condition key as plain values with the empty CircleDirection (NaN outside Circle in a plain read_csv)
+# as '', so NaN != NaN neither splits a condition into one-row runs nor fails to match between the logs
+def condition_keys(data):
+    keys = pd.DataFrame({column: np.asarray(data[column], dtype=object) for column in CONDITION_KEY})
+    keys['CircleDirection'] = keys['CircleDirection'].fillna('').astype(str)
+    return keys
+
+# Conditions of a log: runs of the condition key, also split where the timestamp restarts
+def segment_starts(data):
+    return np.union1d(run_starts(condition_keys(data), CONDITION_KEY), timestamp_segments(data['SystemClockTimestampMs']))
+
+# Key values per segment; Occurrence numbers repeated runs of the same condition
+def _segment_keys(data, starts):
+    keys = condition_keys(data).iloc[starts].reset_index(drop=True)
+    keys['Occurrence'] = keys.groupby(CONDITION_KEY, dropna=False).cumcount()
+    return keys
+
+# For every selection segment the matching high-frequency segment (the n-th run of a condition in one log
+# is matched to the n-th run in the other), -1 without one
+def match_segments(selections, selection_starts, samples, sample_starts):
+    selection_keys = _segment_keys(selections, selection_starts)
+    sample_keys = _segment_keys(samples, sample_starts)
+    sample_keys['Segment'] = np.arange(len(sample_starts))
+    matched = selection_keys.merge(sample_keys, on=[*CONDITION_KEY, 'Occurrence'], how='left')
+    return matched['Segment'].fillna(-1).to_numpy(np.int64)
+
+### As-of join
+# Sorted (segment, timestamp) keys as one int64; timestamps must be non-negative and increase within segments
+def _keys(segment, timestamps, span):
+    return segment.astype(np.int64) * span + np.asarray(timestamps, dtype=np.int64)
+
+# For every query the samples before (left) and after (right) it within its segment and the interpolation
+# weight of right; queries outside the samples of their segment take the first / last sample (weight 0),
+# queries without a segment get -1
+def asof_indices(sample_segment, sample_timestamps, query_segment, query_timestamps):
+    sample_timestamps = np.asarray(sample_timestamps, dtype=np.int64)
+    query_timestamps = np.asarray(query_timestamps, dtype=np.int64)
+    unmatched = np.full(len(query_timestamps), -1, dtype=np.int64)
+    if len(sample_timestamps) == 0:
+        return unmatched, unmatched, np.full(len(query_timestamps), np.nan)
+    span = int(max(sample_timestamps.max(), query_timestamps.max(initial=0))) + 1
+    sample_keys = _keys(sample_segment, sample_timestamps, span)
+    # First and last sample row of every segment
+    segments = np.arange(sample_segment[-1] + 1)
+    first = np.searchsorted(sample_segment, segments, side='left')
+    last = np.searchsorted(sample_segment, segments, side='right') - 1
+
+    valid = (query_segment >= 0) & (query_segment < len(segments))
+    segment = np.where(valid, query_segment, 0)
+    right = np.clip(np.searchsorted(sample_keys, _keys(segment, query_timestamps, span), side='left'), first[segment], last[segment])
+    left = np.where(sample_timestamps[right] == query_timestamps, right, np.maximum(right - 1, first[segment]))
+    gap = (sample_timestamps[right] - sample_timestamps[left]).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.clip(np.where(gap > 0, (query_timestamps - sample_timestamps[left]) / gap, 0.0), 0, 1)
+    return np.where(valid, left, unmatched), np.where(valid, right, unmatched), np.where(valid, weight, np.nan)
+
+# Unmatched queries (index -1) pick the NaN row appended to the values
+def _with_missing(values):
+    values = np.asarray(values, dtype=np.float64)
+    return np.concatenate([values, np.full((1, *values.shape[1:]), np.nan)])
+
+def interpolate(values, left, right, weight):
+    values = _with_missing(values)
+    return values[left] * (1 - weight) + values[right] * weight
+
+# Normalized linear interpolation on the shorter arc
+def interpolate_quaternions(q, left, right, weight):
+    q = _with_missing(q)
+    a, b = q[left], q[right]
+    b = np.where(np.einsum('ij,ij->i', a, b)[:, None] < 0, -b, b)
+    return normalize(a * (1 - weight[:, None]) + b * weight[:, None])
+
+### Join
+# selections with the interpolated pose columns, HeadPitch (degrees, positive looking up), the target geometry of targetGeometry.py,
+# PoseGapMs (time between the two samples used) and PoseOffsetMs (time to the nearest sample)
+def join_pose(selections, samples):
+    selection_starts = segment_starts(selections)
+    sample_starts = segment_starts(samples)
+    sample_segment = segment_ids(sample_starts, len(samples))
+    selection_segment = np.repeat(match_segments(selections, selection_starts, samples, sample_starts),
+                                  segment_lengths(selection_starts, len(selections)))
+    timestamps = samples['SystemClockTimestampMs'].to_numpy()
+    selection_timestamps = selections['SystemClockTimestampMs'].to_numpy()
+    left, right, weight = asof_indices(sample_segment, timestamps, selection_segment, selection_timestamps)
+
+    result = selections.copy()
+    pose = {column: interpolate(samples[column], left, right, weight) for column in VECTOR_COLUMNS}
+    for pose_object in QUATERNION_OBJECTS:
+        quaternion = interpolate_quaternions(samples[[pose_object + component for component in COMPONENTS]].to_numpy(), left, right, weight)
+        for index, component in enumerate(COMPONENTS):
+            pose[pose_object + component] = quaternion[:, index]
+    sample_times = _with_missing(timestamps)
+    pose['PoseGapMs'] = sample_times[right] - sample_times[left]
+    pose['PoseOffsetMs'] = np.minimum(np.abs(selection_timestamps - sample_times[left]), np.abs(sample_times[right] - selection_timestamps))
+    with np.errstate(invalid='ignore'):
+        forward_length = np.sqrt(pose['HeadForwardX'] ** 2 + pose['HeadForwardY'] ** 2 + pose['HeadForwardZ'] ** 2)
+        pose['HeadPitch'] = np.rad2deg(np.arcsin(np.clip(pose['HeadForwardY'] / forward_length, -1, 1)))
+    pose.update(target_geometry(
+        pose['HeadPositionX'], pose['HeadPositionY'], pose['HeadPositionZ'], pose['TrackPositionY'],
+        pose['WalkingDirectionForwardX'], pose['WalkingDirectionForwardZ'],
+        pose['AllTargetsPositionX'], pose['AllTargetsPositionY'], pose['AllTargetsPositionZ'],
+    ))
+    pose.update(relative_target_angles(
+        pose['HeadPositionX'], pose['HeadPositionY'], pose['HeadPositionZ'],
+        pose['AllTargetsPositionX'], pose['AllTargetsPositionY'], pose['AllTargetsPositionZ'],
+        pose['AllTargetsForwardX'], pose['AllTargetsForwardY'], pose['AllTargetsForwardZ'],
+    ))
+    return pd.concat([result.reset_index(drop=True), pd.DataFrame(pose)], axis=1)
+
+### Per participant / study
+SAMPLE_COLUMNS = [*CONDITION_KEY, 'SystemClockTimestampMs', *POSE_COLUMNS]
+
+def participant_selection_pose(args):
+    selections_path, samples_path = args
+    selections = read_log(selections_path, dtype=SELECTION_DTYPES, cache=True)
+    return join_pose(selections, read_log(samples_path, SAMPLE_COLUMNS, HIGH_FREQUENCY_DTYPES, cache=True))
+
+def study_selection_pose(directory, participant_start, participant_end, workers=None):
+    samples = dict(participant_files(directory, HIGH_FREQUENCY, participant_start, participant_end))
+    paths = [(path, samples[participant_id]) for participant_id, path in participant_files(directory, SELECTIONS, participant_start, participant_end)
+             if participant_id in samples]
+    return concat_logs(map_participants(participant_selection_pose, paths, workers))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory')
+    parser.add_argument('--participants', type=int, nargs=2, metavar=('START', 'END'), default=[5, 28])
+    parser.add_argument('--workers', type=int, help='participants processed in parallel (default: all cores)')
+    args = parser.parse_args()
+    participant_start, participant_end = args.participants
+    selections = study_selection_pose(args.directory, participant_start, participant_end, args.workers)
+    selections.to_csv(str(participant_start) + "-" + str(participant_end) + "_" + "selection_pose.csv", index=False)
+    unmatched = int(selections['PoseGapMs'].isna().sum())
+    if unmatched:
+        print(f'{unmatched} selections without high-frequency samples of their condition')
+    print(selections.groupby(['ReferenceFrame', 'Movement'], observed=True)[['HeadPitch', 'Decline', 'Depth', 'LateralShift', 'RelativeTargetPitch', 'RelativeTargetYaw']].mean().to_string(float_format='%.3f'))
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import scipy.stats
+
+# Mauchly's test of sphericity with Greenhouse-Geisser / Huynh-Feldt epsilons (as R mauchly.test and
+# pingouin.sphericity / pingouin.epsilon) for every within effect and dependent variable at once.
+# The long-format frame is pivoted once into a participant x condition array; the per-effect covariance
+# matrices, determinants and traces are computed batched over dependent variables.
+
+WITHIN_FACTORS = ['Movement', 'ReferenceFrame', 'TargetSize']
+ALPHA = 0.05
+
+# k x (k - 1) orthonormal contrasts (orthogonal to the constant); the tests do not depend on the choice
+def orthonormal_contrasts(k):
+    basis = np.column_stack([np.ones(k), np.eye(k)[:, :k - 1]])
+    return np.linalg.qr(basis)[0][:, 1:]
+
+### Pivot
+# Per-cell sums and counts, shape (dependent variable, participant, level of factor 1, level of factor 2, ...);
+# cell means of any marginal are sums / counts over the other factors, like pivot_table(aggfunc='mean')
+def participant_condition_array(data, dependent_variables, factors=WITHIN_FACTORS, subject='ParticipantID'):
+    grouped = data.groupby([subject, *factors], observed=True)[dependent_variables]
+    sums = grouped.sum(min_count=1)
+    counts = grouped.count()
+    index = pd.MultiIndex.from_product([sums.index.unique(level) for level in [subject, *factors]])
+    shape = (len(dependent_variables), *(len(level) for level in index.levels))
+    sums = sums.reindex(index).to_numpy(dtype=np.float64).T.reshape(shape)
+    counts = counts.reindex(index).fillna(0).to_numpy(dtype=np.float64).T.reshape(shape)
+    return np.nan_to_num(sums), counts
+
+def _effect_means(sums, counts, factors, effect):
+    other_axes = tuple(2 + i for i, factor in enumerate(factors) if factor not in effect)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums.sum(axis=other_axes) / counts.sum(axis=other_axes)
+    # (dependent variable, participant, cells of the effect); empty cells are NaN
+    return means.reshape(means.shape[0], means.shape[1], -1)
+
+### Tests
+def _effect_tests(means, contrasts):
+    # Listwise deletion per dependent variable: participants with any empty cell are left out
+    valid = ~np.isnan(means).any(axis=2)
+    n = valid.sum(axis=1).astype(np.float64)
+    values = np.where(valid[:, :, None], means, 0.0)
+    centred = np.where(valid[:, :, None], values - values.sum(axis=1, keepdims=True) / n[:, None, None], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = np.einsum('vpi,vpj->vij', centred, centred) / (n - 1)[:, None, None]
+    M = contrasts.T @ covariance @ contrasts
+    k, d = contrasts.shape
+    df_resid = n - 1
+
+    trace = np.trace(M, axis1=1, axis2=2)
+    trace_squared = np.trace(M @ M, axis1=1, axis2=2)
+    sign, logdet = np.linalg.slogdet(M)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_w = np.where(sign > 0, logdet - d * np.log(trace / d), -np.inf)
+        # R uses the number of cells k in the second-order term (pingouin follows R)
+        f = 1 - (2 * d**2 + d + 2) / (6 * d * df_resid)
+        w2 = (d + 2) * (d - 1) * (d - 2) * (2 * d**3 + 6 * d**2 + 3 * k + 2) / (288 * (df_resid * d * f) ** 2)
+        chi_square = -df_resid * f * log_w
+        dof = d * (d + 1) / 2 - 1
+        p1 = scipy.stats.chi2.sf(chi_square, dof)
+        p2 = scipy.stats.chi2.sf(chi_square, dof + 4)
+        gg = np.minimum(trace**2 / (d * trace_squared), 1)
+        hf = np.minimum((n * d * gg - 2) / (d * (n - 1 - d * gg)), 1)
+    return {'n': n.astype(int), 'W': np.exp(log_w), 'chi2': chi_square, 'dof': int(dof), 'p': p1 + w2 * (p2 - p1),
+            'eps_GG': gg, 'eps_HF': hf, 'eps_LB': np.full(len(n), 1 / d)}
+
+# One row per dependent variable x effect. Effects are factor names (main effects) or tuples of factors
+# (interactions, Kronecker product of the contrasts); default: every within factor
+def sphericity_table(data, dependent_variables, factors=WITHIN_FACTORS, effects=None, subject='ParticipantID', alpha=ALPHA):
+    effects = factors if effects is None else effects
+    sums, counts = participant_condition_array(data, dependent_variables, factors, subject)
+    tables = []
+    for effect in effects:
+        effect = (effect,) if isinstance(effect, str) else tuple(effect)
+        means = _effect_means(sums, counts, factors, effect)
+        levels = [counts.shape[2 + factors.index(factor)] for factor in effect]
+        contrasts = np.ones((1, 1))
+        for k in levels:
+            contrasts = np.kron(contrasts, orthonormal_contrasts(k))
+        table = pd.DataFrame({'DependentVariable': dependent_variables, 'Effect': ' * '.join(effect)})
+        if contrasts.shape[1] <= 1:
+            # Sphericity always holds with a single degree of freedom
+            table[['n', 'W', 'chi2', 'dof', 'p', 'eps_GG', 'eps_HF', 'eps_LB']] = [0, np.nan, np.nan, 1, 1.0, 1.0, 1.0, 1.0]
+            table['n'] = (~np.isnan(means).any(axis=2)).sum(axis=1)
+        else:
+            for column, values in _effect_tests(means, contrasts).items():
+                table[column] = values
+        table.insert(2, 'Sphericity', table['p'] > alpha)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
@@ -0,0 +1,226 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from participantLoader import map_participants, POSE_COLUMNS, SELECTIONS, HIGH_FREQUENCY
+
+# Synthetic {id}_selections.csv / {id}_highFrequency.csv logs with the column schema of
+# ExperimentManager.cs (selectionLogColumns / highFrequencyLogColumns), so the pipeline can be
+# benchmarked without participant data. Every participant runs the full Movement x ReferenceFrame x
+# TargetSize layout with SELECTIONS_PER_CELL targets per cell while walking a straight line or a circle;
+# poses are logged at SAMPLE_RATE Hz with forward / up vectors and quaternions from one rotation per object.
+
+SELECTION_LOG_COLUMNS = [
+    'ParticipantID', 'SelectionID', 'Movement', 'CircleDirection', 'ReferenceFrame', 'TargetSize', 'DominantHand',
+    'RealtimeSinceStartupMs', 'SystemClockTimestampMs', 'ActiveTargetIndex', 'AbsoluteTargetPositionX', 'AbsoluteTargetPositionY',
+    'AbsoluteSelectionPositionX', 'AbsoluteSelectionPositionY', 'LocalSelectionPositionX', 'LocalSelectionPositionY', 'Success', 'SelectionDuration',
+]
+HIGH_FREQUENCY_LOG_COLUMNS = [
+    'ParticipantID', 'MeasurementID', 'Movement', 'CircleDirection', 'ReferenceFrame', 'TargetSize', 'DominantHand',
+    'RealtimeSinceStartupMs', 'SystemClockTimestampMs', *POSE_COLUMNS,
+    'SelectorProjectionOntoAllTargetsX', 'SelectorProjectionOntoAllTargetsY', 'ActiveTargetIndex',
+    'ActiveTargetInsideAllTargetsX', 'ActiveTargetInsideAllTargetsY', 'IsSelectorInsideCollider', 'DistanceFromSelectorToAllTargetsOXYPlane',
+]
+
+MOVEMENTS = ['Standing', 'Walking', 'Circle']
+REFERENCE_FRAMES = ['PalmReferenced', 'PalmWORotation', 'PathReferenced']
+TARGET_SIZES = [0.02, 0.03, 0.04, 0.05]
+SELECTIONS_PER_CELL = 7
+# Order in which the targets on the circle are activated (across the circle, as in ISO 9241-9)
+TARGET_SEQUENCE = [0, 3, 6, 2, 5, 1, 4]
+SAMPLE_RATE = 90
+TARGETS_RADIUS = 0.08
+WALKING_SPEED = 1.0 # m/s
+CIRCLE_RADIUS = 2.0
+STEP_FREQUENCY = 1.8 # Hz
+CONDITION_PAUSE_MS = 5000
+
+### Rotations
+def yaw_pitch_quaternions(yaw, pitch):
+    # Unity convention: yaw about +Y, then pitch about +X (positive pitch looks down); (x, y, z, w)
+    cy, sy = np.cos(yaw / 2), np.sin(yaw / 2)
+    cp, sp = np.cos(pitch / 2), np.sin(pitch / 2)
+    return np.column_stack([cy * sp, sy * cp, -sy * sp, cy * cp])
+
+def rotate(quaternions, vector):
+    xyz = quaternions[:, :3]
+    w = quaternions[:, 3:]
+    vector = np.broadcast_to(np.asarray(vector, dtype=np.float64), xyz.shape)
+    t = 2 * np.cross(xyz, vector)
+    return vector + w * t + np.cross(xyz, t)
+
+def _pose(columns, name, position, quaternions):
+    columns[name + 'PositionX'], columns[name + 'PositionY'], columns[name + 'PositionZ'] = position.T
+    columns[name + 'ForwardX'], columns[name + 'ForwardY'], columns[name + 'ForwardZ'] = rotate(quaternions, [0, 0, 1]).T
+    columns[name + 'UpX'], columns[name + 'UpY'], columns[name + 'UpZ'] = rotate(quaternions, [0, 1, 0]).T
+    columns[name + 'QuaternionX'], columns[name + 'QuaternionY'], columns[name + 'QuaternionZ'], columns[name + 'QuaternionW'] = quaternions.T
+
+def _target_offsets(index):
+    angle = np.asarray(index) * 2 * np.pi / SELECTIONS_PER_CELL
+    return TARGETS_RADIUS * np.cos(angle), TARGETS_RADIUS * np.sin(angle)
+
+### One condition
+def _condition(rng, movement, circle_direction, reference_frame, target_size, condition_seconds, height):
+    # Selections: Fitts' law movement times (ms); the first selection of a cell is the idle one (duration 0)
+    amplitude = 2 * TARGETS_RADIUS * np.sin(3 * np.pi / SELECTIONS_PER_CELL)
+    movement_time = 350 + 150 * np.log2(amplitude / target_size + 1) * (1.15 if movement != 'Standing' else 1.0)
+    durations = np.maximum(150, rng.normal(movement_time, 0.15 * movement_time, SELECTIONS_PER_CELL)).astype(np.int64)
+    durations[0] = 0
+    selection_times = np.cumsum(durations)
+
+    sample_count = max(int(condition_seconds * SAMPLE_RATE), int(selection_times[-1] * SAMPLE_RATE / 1000) + SAMPLE_RATE)
+    timestamps = np.round(np.arange(sample_count) * 1000 / SAMPLE_RATE).astype(np.int64)
+    time = timestamps / 1000
+    active = np.minimum(np.searchsorted(selection_times, timestamps, side='right'), SELECTIONS_PER_CELL - 1)
+    active_target = np.array(TARGET_SEQUENCE)[active]
+
+    # Track / walking direction along the path
+    speed = 0 if movement == 'Standing' else WALKING_SPEED
+    if movement == 'Circle':
+        sign = 1 if circle_direction == 'Clockwise' else -1
+        angle = sign * speed * time / CIRCLE_RADIUS
+        track = np.column_stack([CIRCLE_RADIUS * (1 - np.cos(angle)) * sign, np.zeros(sample_count), CIRCLE_RADIUS * np.sin(angle) * sign])
+        heading = angle
+    else:
+        track = np.column_stack([np.zeros(sample_count), np.zeros(sample_count), speed * time])
+        heading = np.zeros(sample_count)
+    path_rotation = yaw_pitch_quaternions(heading, np.zeros(sample_count))
+
+    # Head: eye height with vertical bob at the step frequency and lateral sway at half of it
+    walking = speed > 0
+    phase = 2 * np.pi * STEP_FREQUENCY * time + rng.uniform(0, 2 * np.pi)
+    lateral = rotate(path_rotation, [1, 0, 0])
+    head = track + np.column_stack([np.zeros(sample_count), height + 0.02 * walking * np.sin(phase), np.zeros(sample_count)])
+    head += lateral * (0.03 * walking * np.sin(phase / 2))[:, None] + rng.normal(0, 0.002, (sample_count, 3))
+    head_rotation = yaw_pitch_quaternions(heading + rng.normal(0, 0.03, sample_count), 0.35 + rng.normal(0, 0.02, sample_count))
+
+    # Hand held in front of the body; targets on the palm or in front of the head along the path
+    palm_offset = np.array([0.15, -0.45, 0.35])
+    palm = head + rotate(path_rotation, palm_offset) + rng.normal(0, 0.005, (sample_count, 3))
+    palm_rotation = yaw_pitch_quaternions(heading + rng.normal(0, 0.1, sample_count), -1.2 + rng.normal(0, 0.1, sample_count))
+    if reference_frame == 'PathReferenced':
+        all_targets = track + rotate(path_rotation, [0.1, height - 0.5, 0.4])
+        targets_rotation = yaw_pitch_quaternions(heading, np.full(sample_count, 0.6))
+    else:
+        all_targets = palm + rotate(palm_rotation, [0, 0.05, 0])
+        targets_rotation = palm_rotation if reference_frame == 'PalmReferenced' else yaw_pitch_quaternions(heading, np.full(sample_count, 0.6))
+    target_x, target_y = _target_offsets(active_target)
+    active_position = all_targets + rotate(targets_rotation, [1, 0, 0]) * target_x[:, None] + rotate(targets_rotation, [0, 1, 0]) * target_y[:, None]
+
+    # Index tip approaches the active target between selections
+    approach = np.clip((timestamps - np.concatenate([[0], selection_times])[active]) / np.maximum(durations[active], 1), 0, 1)
+    index_tip = active_position + (1 - approach)[:, None] * rng.normal(0, 0.03, (sample_count, 3))
+    projection_x = target_x + (1 - approach) * rng.normal(0, 0.02, sample_count)
+    projection_y = target_y + (1 - approach) * rng.normal(0, 0.02, sample_count)
+    distance = np.hypot(projection_x - target_x, projection_y - target_y) - target_size / 2
+
+    columns = {}
+    _pose(columns, 'Track', track, path_rotation)
+    _pose(columns, 'WalkingDirection', track, path_rotation)
+    _pose(columns, 'Head', head, head_rotation)
+    _pose(columns, 'DominantPalmCenter', palm, palm_rotation)
+    _pose(columns, 'DominantIndexTip', index_tip, palm_rotation)
+    _pose(columns, 'Controller', palm + rng.normal(0, 0.01, (sample_count, 3)), palm_rotation)
+    _pose(columns, 'AllTargets', all_targets, targets_rotation)
+    _pose(columns, 'ActiveTarget', active_position, targets_rotation)
+    columns['SelectorProjectionOntoAllTargetsX'] = projection_x
+    columns['SelectorProjectionOntoAllTargetsY'] = projection_y
+    columns['ActiveTargetIndex'] = active_target
+    columns['ActiveTargetInsideAllTargetsX'] = target_x
+    columns['ActiveTargetInsideAllTargetsY'] = target_y
+    columns['IsSelectorInsideCollider'] = (distance < 0).astype(np.int8)
+    columns['DistanceFromSelectorToAllTargetsOXYPlane'] = distance
+    high_frequency = pd.DataFrame(columns)
+    high_frequency['SystemClockTimestampMs'] = timestamps
+
+    selection_target_x, selection_target_y = _target_offsets(TARGET_SEQUENCE)
+    spread = target_size * 0.35
+    selection_x = selection_target_x + rng.normal(0, spread, SELECTIONS_PER_CELL)
+    selection_y = selection_target_y + rng.normal(0, spread, SELECTIONS_PER_CELL)
+    selections = pd.DataFrame({
+        'SystemClockTimestampMs': selection_times,
+        'ActiveTargetIndex': TARGET_SEQUENCE,
+        'AbsoluteTargetPositionX': selection_target_x,
+        'AbsoluteTargetPositionY': selection_target_y,
+        'AbsoluteSelectionPositionX': selection_x,
+        'AbsoluteSelectionPositionY': selection_y,
+        'LocalSelectionPositionX': selection_x - selection_target_x,
+        'LocalSelectionPositionY': selection_y - selection_target_y,
+        'Success': (np.hypot(selection_x - selection_target_x, selection_y - selection_target_y) < target_size / 2).astype(np.int64),
+        'SelectionDuration': durations,
+    })
+    return selections, high_frequency
+
+def _with_conditions(frame, participant_id, movement, circle_direction, reference_frame, target_size, dominant_hand, realtime_start):
+    frame['ParticipantID'] = participant_id
+    frame['Movement'] = movement
+    frame['CircleDirection'] = circle_direction
+    frame['ReferenceFrame'] = reference_frame
+    frame['TargetSize'] = target_size
+    frame['DominantHand'] = dominant_hand
+    frame['RealtimeSinceStartupMs'] = realtime_start + frame['SystemClockTimestampMs']
+    return frame
+
+### One participant
+# Conditions are run movement by movement with reference frames and target sizes shuffled inside
+def participant_logs(participant_id, condition_seconds=20, seed=0, movements=MOVEMENTS, reference_frames=REFERENCE_FRAMES, target_sizes=TARGET_SIZES):
+    rng = np.random.default_rng([seed, participant_id])
+    height = rng.normal(1.65, 0.08)
+    dominant_hand = 'Right' if rng.random() < 0.9 else 'Left'
+    selections = []
+    high_frequency = []
+    realtime = int(rng.integers(5000, 20000))
+    for movement in movements:
+        for reference_frame in rng.permutation(reference_frames):
+            for target_size in rng.permutation(target_sizes):
+                # A new random direction for every circle run, empty otherwise (as logged by ExperimentManager.cs)
+                direction = rng.choice(['Clockwise', 'CounterClockwise']) if movement == 'Circle' else ''
+                condition_selections, condition_high_frequency = _condition(rng, movement, direction, reference_frame, target_size, condition_seconds, height)
+                conditions = (participant_id, movement, direction, reference_frame, target_size, dominant_hand, realtime)
+                selections.append(_with_conditions(condition_selections, *conditions))
+                high_frequency.append(_with_conditions(condition_high_frequency, *conditions))
+                realtime += int(condition_high_frequency['SystemClockTimestampMs'].iloc[-1]) + CONDITION_PAUSE_MS
+    selections = pd.concat(selections, ignore_index=True)
+    selections['SelectionID'] = np.arange(1, len(selections) + 1)
+    high_frequency = pd.concat(high_frequency, ignore_index=True)
+    high_frequency['MeasurementID'] = np.arange(len(high_frequency))
+    return selections[SELECTION_LOG_COLUMNS], high_frequency[HIGH_FREQUENCY_LOG_COLUMNS]
+
+def _write_participant(args):
+    directory, participant_id, condition_seconds, seed, movements, reference_frames, target_sizes = args
+    selections, high_frequency = participant_logs(participant_id, condition_seconds, seed, movements, reference_frames, target_sizes)
+    selections.to_csv(os.path.join(directory, f'{participant_id}_{SELECTIONS}.csv'), index=False)
+    high_frequency.to_csv(os.path.join(directory, f'{participant_id}_{HIGH_FREQUENCY}.csv'), index=False, float_format='%.6g')
+    return participant_id
+
+# Writes the logs of participants participant_start..participant_end (inclusive) into directory;
+# existing files are kept unless overwrite is set, so a larger study extends a smaller one (with the same layout)
+def write_study(directory, participant_start, participant_end, condition_seconds=20, seed=0, workers=None, overwrite=False,
+                movements=MOVEMENTS, reference_frames=REFERENCE_FRAMES, target_sizes=TARGET_SIZES):
+    os.makedirs(directory, exist_ok=True)
+    missing = [participant_id for participant_id in range(participant_start, participant_end + 1)
+               if overwrite or not all(os.path.exists(os.path.join(directory, f'{participant_id}_{kind}.csv')) for kind in [SELECTIONS, HIGH_FREQUENCY])]
+    items = [(directory, participant_id, condition_seconds, seed, movements, reference_frames, target_sizes) for participant_id in missing]
+    return map_participants(_write_participant, items, workers)
+
+# Condition layout options, shared with benchmark.py
+def add_layout_arguments(parser):
+    parser.add_argument('--movements', nargs='+', choices=MOVEMENTS, default=MOVEMENTS)
+    parser.add_argument('--reference-frames', nargs='+', choices=REFERENCE_FRAMES, default=REFERENCE_FRAMES)
+    parser.add_argument('--target-sizes', type=float, nargs='+', default=TARGET_SIZES, metavar='M', help='target diameters in m')
+
+def layout_arguments(args):
+    return {'movements': args.movements, 'reference_frames': args.reference_frames, 'target_sizes': args.target_sizes}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('directory')
+    parser.add_argument('--participants', type=int, nargs=2, metavar=('START', 'END'), default=[5, 28])
+    parser.add_argument('--condition-seconds', type=float, default=20, help='minimum length of every condition in the high-frequency log')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, help='participants generated in parallel (default: all cores)')
+    parser.add_argument('--overwrite', action='store_true')
+    add_layout_arguments(parser)
+    args = parser.parse_args()
+    written = write_study(args.directory, *args.participants, args.condition_seconds, args.seed, args.workers, args.overwrite, **layout_arguments(args))
+    print(f'{len(written)} participants written to {args.directory}')
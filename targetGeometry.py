@@ -0,0 +1,115 @@
+import numpy as np
+
+# Batched version of the per-row geometry in computeDependentVariables.py.
+# Every function works on whole columns (numpy arrays or pandas Series) at once.
+
+### Projection of the head-to-target vector onto the walking direction (XZ plane)
+def walking_direction_projection(head_x, head_z, forward_x, forward_z, target_x, target_z):
+    head_to_target_x = target_x - head_x
+    head_to_target_z = target_z - head_z
+    scale = (head_to_target_x * forward_x + head_to_target_z * forward_z) / (forward_x * forward_x + forward_z * forward_z)
+    return scale * forward_x, scale * forward_z, head_to_target_x, head_to_target_z
+
+### Participant height, Decline, Depth, Lateral Shift and their angles in one pass
+def target_geometry(head_x, head_y, head_z, track_y, forward_x, forward_z, target_x, target_y, target_z):
+    head_x, head_y, head_z, track_y = (np.asarray(v) for v in (head_x, head_y, head_z, track_y))
+    forward_x, forward_z = np.asarray(forward_x), np.asarray(forward_z)
+    target_x, target_y, target_z = np.asarray(target_x), np.asarray(target_y), np.asarray(target_z)
+
+    participant_height = head_y - track_y
+    decline = participant_height - target_y
+
+    projection_x, projection_z, head_to_target_x, head_to_target_z = walking_direction_projection(
+        head_x, head_z, forward_x, forward_z, target_x, target_z)
+    depth = np.hypot(projection_x, projection_z)
+
+    # Vector from the projection point to the targets, perpendicular to the walking direction
+    perpendicular_x = head_to_target_x - projection_x
+    perpendicular_z = head_to_target_z - projection_z
+    lateral_shift = np.hypot(perpendicular_x, perpendicular_z)
+    # Negative if the targets are shifted left, positive if shifted right (z of the 2D cross product)
+    cross_product_z = forward_x * perpendicular_z - forward_z * perpendicular_x
+    lateral_shift = np.where(cross_product_z > 0, -lateral_shift, lateral_shift)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        decline_angle = np.rad2deg(np.arctan(decline / depth))
+        lateral_shift_angle = np.rad2deg(np.arctan(lateral_shift / depth))
+
+    return {
+        'ParticipantHeight': participant_height,
+        'Decline': decline,
+        'Depth': depth,
+        'LateralShift': lateral_shift,
+        'DeclineAngle': decline_angle,
+        'LateralShiftAngle': lateral_shift_angle,
+    }
+
+def add_target_geometry(data):
+    geometry = target_geometry(
+        data['HeadPositionX'], data['HeadPositionY'], data['HeadPositionZ'],
+        data['TrackPositionY'],
+        data['WalkingDirectionForwardX'], data['WalkingDirectionForwardZ'],
+        data['AllTargetsPositionX'], data['AllTargetsPositionY'], data['AllTargetsPositionZ'],
+    )
+    for column, values in geometry.items():
+        data[column] = values
+    return data
+
+# Rows whose vectors are shorter than this are treated as degenerate (e.g. target directly above the head)
+DEGENERATE_NORM = 1e-6
+
+def _normalize(vectors):
+    norm = np.linalg.norm(vectors, axis=1, keepdims=True)
+    degenerate = norm < DEGENERATE_NORM
+    norm[degenerate] = 1
+    vectors = vectors / norm
+    vectors[degenerate[:, 0]] = np.nan
+    return vectors
+
+def _stack(x, y, z, dtype):
+    return np.column_stack((np.asarray(x, dtype=dtype), np.asarray(y, dtype=dtype), np.asarray(z, dtype=dtype)))
+
+def _signed_angle(a, b, positive):
+    cos_angle = np.clip(np.einsum('ij,ij->i', a, b), -1, 1)
+    angle = np.rad2deg(np.arccos(cos_angle))
+    return np.where(positive, angle, -angle)
+
+### Relative Pitch and Relative Yaw
+# Degenerate rows (head at the targets, target straight above/below the head, targets facing
+# along the plane normal) are set to NaN by _normalize and propagate as NaN without warnings,
+# so per-condition means simply skip them.
+def relative_target_angles(head_x, head_y, head_z, target_x, target_y, target_z,
+                           target_forward_x, target_forward_y, target_forward_z, float32=False):
+    dtype = np.float32 if float32 else np.float64
+    up_vector = np.array([0, 1, 0], dtype=dtype)
+
+    with np.errstate(invalid='ignore'):
+        target_to_head_vector = _normalize(_stack(head_x, head_y, head_z, dtype) - _stack(target_x, target_y, target_z, dtype))
+        targets_vector = _normalize(-_stack(target_forward_x, target_forward_y, target_forward_z, dtype))
+        # Normal of the vertical plane containing target_to_head_vector
+        vertical_normal = _normalize(np.cross(target_to_head_vector, up_vector))
+        # Normal of the plane orthogonal to the vertical one, also containing target_to_head_vector
+        horizontal_normal = _normalize(np.cross(vertical_normal, target_to_head_vector))
+
+        pitch_projection = _normalize(targets_vector - np.einsum('ij,ij->i', targets_vector, vertical_normal)[:, None] * vertical_normal)
+        yaw_projection = _normalize(targets_vector - np.einsum('ij,ij->i', targets_vector, horizontal_normal)[:, None] * horizontal_normal)
+
+        # Positive pitch if the targets point higher than target_to_head_vector
+        pitch = _signed_angle(target_to_head_vector, pitch_projection, pitch_projection[:, 1] > target_to_head_vector[:, 1])
+        yaw = _signed_angle(target_to_head_vector, yaw_projection, np.einsum('ij,ij->i', yaw_projection, vertical_normal) > 0)
+
+    return {
+        'RelativeTargetPitch': pitch,
+        'RelativeTargetYaw': yaw,
+    }
+
+def add_relative_target_angles(data, float32=False):
+    angles = relative_target_angles(
+        data['HeadPositionX'], data['HeadPositionY'], data['HeadPositionZ'],
+        data['AllTargetsPositionX'], data['AllTargetsPositionY'], data['AllTargetsPositionZ'],
+        data['AllTargetsForwardX'], data['AllTargetsForwardY'], data['AllTargetsForwardZ'],
+        float32=float32,
+    )
+    for column, values in angles.items():
+        data[column] = values
+    return data